@@ -0,0 +1,376 @@
+"""
+Benchmarks of the xds core on synthetic blueprints and records generated
+with faker, seeded so every run times the same inputs.
+
+    python benchmarks/bench_core.py --save benchmarks/baseline.json
+    python benchmarks/bench_core.py --compare benchmarks/baseline.json
+
+--compare flags cases slower per op than the baseline by more than
+--threshold and exits 1 when there are any; it only compares runs of the
+same size. --quick cuts sizes and repeats for a smoke run. Timings are per
+call, the median and min over the repeats.
+"""
+
+import argparse
+import json
+import keyword
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+# Registry boots off paths relative to the repo root
+os.chdir(ROOT)
+os.environ.setdefault('XDS_CACHE_DIR', tempfile.mkdtemp(prefix='xds-bench-'))
+
+import yaml
+from faker import Faker
+
+from xds.core.blueprint import parse_blueprint
+from xds.core.dynamo import Dynamo
+from xds.core.field import field_spec
+from xds.core.registry import Registry
+from xds.utils.dates import date_modifier
+from xds.utils.helpers import (
+    SingletonMeta,
+    input_dict,
+    input_records,
+    io_cache_clear,
+)
+from xds.utils.logger import log
+
+_SPECS = [
+    'str',
+    'int=0',
+    'float=0.0',
+    'bool',
+    'date',
+    'lists=a,b',
+    'listi=1,2#ge=1',
+    'int=5#ge=1#le=10#req',
+    'str#in=x,y,z#fuzzy',
+    'str#start=A#key',
+]
+_DATES = ['T', '1', '-1', '-2B', 'S', 'ME', '1M', '3ME', 'QE', '2QE', 'YE']
+
+
+class Bench:
+    def __init__(self, quick: bool = False, seed: int = 7) -> None:
+        self.quick = quick
+        self.repeat = 3 if quick else 7
+        self.fake = Faker()
+        self.fake.seed_instance(seed)
+        self.tmp = Path(tempfile.mkdtemp(prefix='xds-bench-data-'))
+        self.results: Dict[str, Dict[str, Any]] = {}
+
+    def size(self, full: int) -> int:
+        return max(1, full // 20) if self.quick else full
+
+    def time(
+        self,
+        name: str,
+        fn: Callable[[], Any],
+        setup: Optional[Callable[[], None]] = None,
+        ops: int = 1,
+    ) -> None:
+        """fn timed repeat times after setup, ops it performs per call"""
+        runs: List[float] = []
+        for _ in range(self.repeat):
+            if setup:
+                setup()
+            start = time.perf_counter()
+            fn()
+            runs.append(time.perf_counter() - start)
+        median = statistics.median(runs)
+        self.results[name] = {
+            'median': median,
+            'min': min(runs),
+            'ops': ops,
+            'ops_per_sec': ops / median if median else None,
+        }
+        print(f'{name:<36} {median * 1e3:10.3f} ms  {ops / median:14.1f}/s')
+
+    # synthetic inputs
+
+    def _word(self, taken: set) -> str:
+        while True:
+            word = self.fake.unique.word().lower()
+            if (
+                word not in taken
+                and word.isidentifier()
+                and not keyword.iskeyword(word)
+            ):
+                taken.add(word)
+                return word
+
+    def blueprint(self, kind: str, width: int, depth: int = 0) -> Dict:
+        taken: set = {'kind', 'ns', 'nsid', 'uid'}
+        data: Dict[str, Any] = {'kind': kind, 'ns': 'str#key'}
+        for i in range(width):
+            data[self._word(taken)] = _SPECS[i % len(_SPECS)]
+        if depth:
+            child = self.blueprint(f'{kind}L{depth}', width, depth - 1)
+            data[self._word(taken)] = child
+        return data
+
+    def records(self, count: int) -> List[Dict[str, Any]]:
+        return [
+            {
+                'kind': 'Person',
+                'ns': f'p{i}',
+                'name': self.fake.name(),
+                'email': self.fake.email(),
+                'age': str(self.fake.random_int(18, 90)),
+                'score': self.fake.pyfloat(min_value=0, max_value=100),
+                'joined': self.fake.date(),
+                'tags': ','.join(self.fake.words(3)),
+            }
+            for i in range(count)
+        ]
+
+    # cases
+
+    def fresh_factory(self) -> Dynamo:
+        SingletonMeta._instances.pop(Dynamo, None)
+        return Dynamo()
+
+    def bench_d2c(self) -> None:
+        shapes = {
+            'small': self.blueprint('Small', 8),
+            'deep': self.blueprint('Deep', 6, depth=self.size(40)),
+            'wide': self.blueprint('Wide', self.size(400)),
+        }
+        for shape, data in shapes.items():
+            text = yaml.safe_dump(data, sort_keys=False)
+            self.time(
+                f'd2c.{shape}.parse',
+                lambda text=text: parse_blueprint(content=text),
+            )
+            blueprint = parse_blueprint(content=text)
+            factories = []
+
+            def _fresh(factories: List[Dynamo] = factories) -> None:
+                factories[:] = [self.fresh_factory()]
+
+            self.time(
+                f'd2c.{shape}.build',
+                lambda bp=blueprint, fs=factories: fs[0].d2c(blueprint=bp),
+                setup=_fresh,
+            )
+            self.time(
+                f'd2c.{shape}.cached',
+                lambda bp=blueprint, fs=factories: fs[0].d2c(blueprint=bp),
+            )
+
+    def bench_instances(self) -> None:
+        factory = self.fresh_factory()
+        factory.d2c(
+            content=(
+                'kind: Person\n'
+                'ns: str#key\n'
+                'name: str\n'
+                'email: str\n'
+                'age: int=0\n'
+                'score: float\n'
+                'joined: date\n'
+                'tags: lists\n'
+            )
+        )
+        records = self.records(self.size(5000))
+        self.time(
+            'instance',
+            lambda: [factory.instance(**r) for r in records],
+            ops=len(records),
+        )
+        self.time(
+            'instances_many',
+            lambda: list(factory.instances_many(records, kind='Person')),
+            ops=len(records),
+        )
+
+    def bench_field_spec(self) -> None:
+        # distinct strings, the trailing token is not a modifier
+        specs = [f'{base}#n{i}' for base in _SPECS for i in range(50)]
+        self.time(
+            'field_spec.cold',
+            lambda: [field_spec(s) for s in specs],
+            setup=field_spec.cache_clear,
+            ops=len(specs),
+        )
+        self.time(
+            'field_spec.memoized',
+            lambda: [field_spec(s) for s in specs],
+            ops=len(specs),
+        )
+
+    def bench_registry(self) -> None:
+        def _reset() -> None:
+            SingletonMeta._instances.pop(Registry, None)
+            SingletonMeta._instances.pop(Dynamo, None)
+            io_cache_clear()
+
+        self.time('registry.boot.lazy', Registry, setup=_reset)
+        self.time(
+            'registry.boot.preload',
+            lambda: Registry(lazy=False),
+            setup=_reset,
+        )
+        registry = Registry()
+        factory = registry.factory
+        factory.d2c(content='kind: Leaf\nns: str')
+        count = self.size(2000)
+        list(
+            registry.instances_many(
+                ({'ns': f'leaf{i}'} for i in range(count)), kind='Leaf'
+            )
+        )
+        exact = [f'instances/leaf/leaf{i}' for i in range(count)]
+        fuzzy = [f'instances/x/leaf{i}' for i in range(count)]
+        clear = registry._located.cache_clear
+        self.time(
+            'locator.exact',
+            lambda: [registry.locator(k) for k in exact],
+            setup=clear,
+            ops=count,
+        )
+        self.time(
+            'locator.fuzzy',
+            lambda: [registry.locator(k) for k in fuzzy],
+            setup=clear,
+            ops=count,
+        )
+        self.time(
+            'locator.memoized',
+            lambda: [registry.locator(k) for k in exact],
+            ops=count,
+        )
+
+    def bench_input(self) -> None:
+        records = self.records(self.size(20000))
+        doc = {r['ns']: r for r in records}
+        files = {
+            'json': json.dumps(doc),
+            'yaml': json.dumps(doc, indent=1),  # json is valid yaml
+        }
+        for ext, text in files.items():
+            path = self.tmp / f'large.{ext}'
+            path.write_text(text)
+            self.time(
+                f'input_dict.{ext}',
+                lambda path=path: input_dict(file=path),
+                setup=io_cache_clear,
+                ops=len(records),
+            )
+        jsonl = self.tmp / 'large.jsonl'
+        jsonl.write_text('\n'.join(json.dumps(r) for r in records))
+        self.time(
+            'input_records.jsonl',
+            lambda: sum(1 for _ in input_records(file=jsonl)),
+            ops=len(records),
+        )
+
+    def bench_dates(self) -> None:
+        patterns = _DATES * self.size(250)
+        self.time(
+            'date_modifier',
+            lambda: [date_modifier(p, '2024-05-15') for p in patterns],
+            ops=len(patterns),
+        )
+
+    def run(self, only: Optional[List[str]] = None) -> Dict[str, Any]:
+        cases = [n[6:] for n in dir(self) if n.startswith('bench_')]
+        for case in cases:
+            if not only or case in only:
+                getattr(self, f'bench_{case}')()
+        return {'meta': _meta(self.quick), 'results': self.results}
+
+
+def _meta(quick: bool) -> Dict[str, Any]:
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'quick': quick,
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+
+
+def compare(
+    baseline: Dict[str, Any], current: Dict[str, Any], threshold: float
+) -> List[str]:
+    """
+    Cases whose time per op is more than threshold slower than the baseline.
+    Cases run with other sizes (ops) than the baseline are skipped, a quick
+    run is not compared with a full one.
+    """
+    quick = baseline['meta'].get('quick'), current['meta'].get('quick')
+    if quick[0] != quick[1]:
+        raise ValueError(
+            f'Baseline quick={quick[0]} vs current quick={quick[1]}, '
+            'compare runs of the same size'
+        )
+    regressions = []
+    print(f'\n{"case":<36} {"baseline":>12} {"current":>12} {"change":>8}')
+    for name, result in current['results'].items():
+        per_op = result['median'] / result['ops']
+        base = baseline['results'].get(name)
+        if not base or base['ops'] != result['ops']:
+            print(f'{name:<36} {"-":>12} {per_op * 1e6:>10.3f}us')
+            continue
+        base_per_op = base['median'] / base['ops']
+        change = per_op / base_per_op - 1
+        flag = ''
+        if change > threshold:
+            regressions.append(name)
+            flag = '  REGRESSION'
+        print(
+            f'{name:<36} {base_per_op * 1e6:>10.3f}us '
+            f'{per_op * 1e6:>10.3f}us {change:>+8.1%}{flag}'
+        )
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--save', type=Path, help='write results as json')
+    parser.add_argument('--compare', type=Path, help='baseline json')
+    parser.add_argument('--threshold', type=float, default=0.10)
+    parser.add_argument('--quick', action='store_true')
+    parser.add_argument('--only', nargs='*', help='cases, e.g. d2c registry')
+    args = parser.parse_args(argv)
+
+    baseline = None
+    if args.compare:
+        baseline = json.loads(args.compare.read_text())
+        # refused before the run rather than after it
+        if baseline['meta'].get('quick') != args.quick:
+            parser.error(f'{args.compare} is not a --quick={args.quick} run')
+    log.set_level('WARNING')
+    current = Bench(quick=args.quick).run(args.only)
+    if args.save:
+        args.save.write_text(json.dumps(current, indent=2) + '\n')
+    if baseline:
+        regressions = compare(baseline, current, args.threshold)
+        if regressions:
+            print(f'\n{len(regressions)} regressions: {", ".join(regressions)}')
+            return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,11 +1,14 @@
 from __future__ import annotations
 
+from collections import OrderedDict
+from collections.abc import Mapping
 from enum import Enum
 from itertools import islice
 from typing import (
     TYPE_CHECKING,
     Any,
     Dict,
+    Iterator,
     List,
     Literal,
     Optional,
@@ -13,9 +16,10 @@ from typing import (
     Union,
 )
 
+import numpy as np
 import pandas as pd
 from pandas import DataFrame, Series
-from pandas.api.types import is_numeric_dtype
+from pandas.api.types import is_list_like, is_numeric_dtype
 
 from refactor.reader import Reader
 from xds.utils.helpers import df_pytypes, icf, xlate, xlation_map
@@ -29,46 +33,170 @@ class DiffType(Enum):
     DIFF = 'diff'
 
 
+def composite_key(df: DataFrame, cols: List[str], sep: str = '|') -> Series:
+    """
+    Values of cols joined by sep per row, e.g. 'x|2', concatenated column
+    by column with vectorized string ops. Missing values render as nan.
+    """
+    parts = [df[col].astype(str).fillna('nan') for col in cols]
+    if len(parts) == 1:
+        return parts[0]
+    return parts[0].str.cat(parts[1:], sep=sep)
+
+
+class Rows(Mapping):
+    """
+    Rows of an indexed frame as dicts, key => {column: value}. A row is
+    built on first access and kept in a small LRU, instead of one dict per
+    row up front. Duplicate keys give their first row.
+    """
+
+    def __init__(self, df: DataFrame, size: int = 1024) -> None:
+        self.df = df
+        self.size = size
+        self._rows: OrderedDict[Any, Dict[str, Any]] = OrderedDict()
+
+    def __getitem__(self, key: Any) -> Dict[str, Any]:
+        row = self._rows.get(key)
+        if row is not None:
+            self._rows.move_to_end(key)
+            return row
+        pos = self.df.index.get_loc(key)
+        if isinstance(pos, slice):
+            pos = pos.start
+        elif not isinstance(pos, (int, np.integer)):
+            pos = int(np.flatnonzero(pos)[0])
+        row = self.df.iloc[[pos]].to_dict(orient='records')[0]
+        if self.size:
+            self._rows[key] = row
+            if len(self._rows) > self.size:
+                self._rows.popitem(last=False)
+        return row
+
+    def __contains__(self, key: object) -> bool:
+        try:
+            return key in self.df.index
+        except TypeError:
+            return False
+
+    def __iter__(self) -> Iterator[Any]:
+        return iter(self.df.index)
+
+    def __len__(self) -> int:
+        return len(self.df)
+
+    def invalidate(self, key: Any = None) -> None:
+        """Drop the cached row of key, every cached row without one"""
+        if key is None:
+            self._rows.clear()
+        else:
+            self._rows.pop(key, None)
+
+
 class DS:
-    def __init__(self, **kwargs: Any) -> None:
-        self.create(**kwargs)
+    """
+    Keyed dataset over a DataFrame. kv reads rows lazily off the indexed
+    frame (row_cache rows kept, default 1024). The source frame is only
+    kept, as _odf, with keep_source=True.
+
+    index=['region', 'desk'] builds a secondary index per column, value =>
+    row positions, kv_search then intersects positions instead of scanning.
+
+    upsert and delete apply deltas in place, keys, indexes, kv and counts
+    of the rows touched only. version goes up with every change, caches
+    built off the dataset keep the version they saw to know when to refresh.
+    """
+
+    def __init__(self, source: Optional[SourceType] = None, **kwargs: Any):
+        if source is not None:
+            kwargs['source'] = source
+        self._create(**kwargs)
 
     @classmethod
     def create(cls, **kwargs: Any) -> DS:
         instance = cls.__new__(cls)
+        instance._create(**kwargs)
+        return instance
 
+    def _create(self, **kwargs: Any) -> None:
         source = kwargs.get('source')
         keys = kwargs.get('keys', [])
         children = kwargs.get('children', {})
+        self.keep_source: bool = kwargs.get('keep_source', False)
+        self.row_cache: int = kwargs.get('row_cache', 1024)
 
-        instance._to_df(source)
+        self._to_df(source)
 
         if isinstance(keys, str):
             keys = keys.split(',')
-        refs = instance._xdf(list(keys), children)
+        refs = self._xdf(list(keys), children)
+        if not self.keep_source:
+            del self._odf
 
-        instance.schema = refs['schema']
-        instance.df = refs['df']
-        instance.children = refs['children']
-        instance.xlations = xlation_map(instance.df.columns)
-        instance.xlations.pop('var', None)
-        instance.kv = refs['kv']
-        instance.length = instance.df.count()
+        self.schema = refs['schema']
+        self.df = refs['df']
+        self.children = refs['children']
+        self.xlations = xlation_map(self.df.columns)
+        self.xlations.pop('var', None)
+        self.kv = refs['kv']
+        self.length = self.df.count()
+        self.version = 0
 
-        return instance
+        index = kwargs.get('index') or []
+        if isinstance(index, str):
+            index = index.split(',')
+        self.index_cols = [xlate(col)[0] for col in index]
+        unknown = set(self.index_cols) - set(self.df.columns)
+        if unknown:
+            raise ValueError(f'Unknown index columns: {unknown}')
+        self._build_indexes()
+
+    def _build_indexes(self) -> None:
+        self.indexes: Dict[str, Dict[Any, np.ndarray]] = {
+            col: self.df.groupby(col, sort=False).indices
+            for col in self.index_cols
+        }
+
+    def _positions(self, field: str, value: Any) -> np.ndarray:
+        index = self.indexes[field]
+        if not isinstance(value, (list, tuple)):
+            return index.get(value, np.empty(0, dtype=np.intp))
+        hits = [index[v] for v in value if v in index]
+        if not hits:
+            return np.empty(0, dtype=np.intp)
+        return np.unique(np.concatenate(hits))
 
     def kv_search(self, kw: Dict[str, Any]) -> DataFrame:
-        mask: Series = Series(True, index=self.df.index)
+        terms = {}
         for field, val in kw.items():
             if field in self.df.columns:
                 value = val
                 if isinstance(val, str):
                     value = value.split(',')
-                if isinstance(value, (list, tuple)):
-                    mask &= self.df[field].isin(value)
-                else:
-                    mask &= self.df[field] == value
-        return self.df[mask]
+                terms[field] = value
+
+        df = self.df
+        indexed = [field for field in terms if field in self.indexes]
+        if indexed:
+            positions = self._positions(indexed[0], terms[indexed[0]])
+            for field in indexed[1:]:
+                positions = np.intersect1d(
+                    positions,
+                    self._positions(field, terms[field]),
+                    assume_unique=True,
+                )
+            df = df.iloc[positions]
+
+        # whatever is not indexed is scanned on the rows left
+        mask: Series = Series(True, index=df.index)
+        for field, value in terms.items():
+            if field in self.indexes:
+                continue
+            if isinstance(value, (list, tuple)):
+                mask &= df[field].isin(value)
+            else:
+                mask &= df[field] == value
+        return df[mask.to_numpy()]
 
     def _to_df(self, data: SourceType) -> None:
         xp, xdf = Reader().to_df(data)
@@ -86,7 +214,8 @@ class DS:
             children = {}
         if keys is None:
             keys = []
-        df: pd.DataFrame = self._odf.copy()
+        # the reader hands over a frame of our own, only copied when kept
+        df: pd.DataFrame = self._odf.copy() if self.keep_source else self._odf
         self.keys = [xlate(var)[0] for var in keys]
         schema = df_pytypes(df)
         nested = [col for col, ptype in schema.items() if ptype == 'pd']
@@ -98,7 +227,7 @@ class DS:
             unknown = set(self.keys) - set(df.columns)
             if unknown:
                 raise ValueError(f'Unknown keys: {unknown}')
-            df['key'] = df[self.keys].astype(str).agg('|'.join, axis=1)
+            df['key'] = composite_key(df, self.keys)
             df.set_index('key', inplace=True)
 
         nodes: Dict[str, 'DS'] = {}
@@ -115,17 +244,19 @@ class DS:
                 ndf['pkey'] = ndf.index.get_level_values(0)
                 ndf.reset_index(inplace=True, drop=True)
                 ckeys: List[str] = ['pkey', *ccols]
-                nodes[child] = DS(ndf, keys=ckeys)
+                nodes[child] = DS.create(source=ndf, keys=ckeys)
 
         for child in nested:
             df.drop(child, axis=1, inplace=True)
 
         return {
-            'schema': df_pytypes(df),
+            'schema': {
+                col: ptype for col, ptype in schema.items() if col not in nested
+            },
             'df': df,
             'xlations': xlation_map(list(df.columns)),
             'children': nodes,
-            'kv': df.to_dict(orient='index'),
+            'kv': Rows(df, self.row_cache),
         }
 
     @property
@@ -146,23 +277,235 @@ class DS:
         return self.kv.get(key) or {}
 
     def __setitem__(self, key: str, value: Any) -> None:
-        v: Dict[str, Any] = self.kv.get(key) or {}
-        v |= value
-        try:
-            self.df.loc[key] = v
-        except KeyError as err:
-            raise ValueError(f'Key missing {key}') from err
-        self.kv[key] = v
+        if key not in self.df.index:
+            raise ValueError(f'Key missing {key}')
+        self.upsert({key: value})
+
+    def _delta(self, rows: Any) -> Tuple[DataFrame, DataFrame]:
+        """
+        Rows of a delta as a frame indexed by key, with the mask of the cells
+        given. rows is a frame, a list of row dicts, a row dict or key => row
+        dict; keys of rows come from the key columns, else they are appended
+        after the last position. Key columns a key => row dict gives have to
+        render to its key.
+        """
+        keyed = isinstance(rows, Mapping) and all(
+            isinstance(v, Mapping) for v in rows.values()
+        )
+        if isinstance(rows, DataFrame):
+            delta = rows.copy()
+            given = DataFrame(True, index=delta.index, columns=delta.columns)
+        else:
+            index = list(rows) if keyed else None
+            if keyed:
+                records = list(rows.values())
+            else:
+                records = [rows] if isinstance(rows, Mapping) else list(rows)
+            delta = DataFrame(records, index=index)
+            given = DataFrame(
+                [dict.fromkeys(row, True) for row in records],
+                index=index,
+                columns=delta.columns,
+            ).notna()
+        delta.columns = given.columns = [xlate(col)[0] for col in delta.columns]
+        unknown = set(delta.columns) - set(self.df.columns)
+        if unknown:
+            raise ValueError(f'Unknown columns: {unknown}')
+        if keyed and self.keys:
+            raw = DataFrame(records, index=index, dtype=object)
+            self._check_keys(raw, given)
+        if not keyed:
+            if self.keys:
+                missing = set(self.keys) - set(delta.columns)
+                if missing:
+                    raise ValueError(f'Key columns missing: {missing}')
+                delta.index = composite_key(delta, self.keys)
+            else:
+                start = int(self.df.index.max()) + 1 if len(self.df) else 0
+                delta.index = pd.RangeIndex(start, start + len(delta))
+        delta.index.name = self.df.index.name
+        given.index = delta.index
+        last = ~delta.index.duplicated(keep='last')
+        return delta[last], given[last]
+
+    def _check_keys(self, raw: DataFrame, given: DataFrame) -> None:
+        """
+        Rows of key => row dicts leave their key columns out (updates) or
+        give values rendering to the key; a new key has to give them all
+        """
+        raw.columns = given.columns
+        cols = given.reindex(columns=self.keys, fill_value=False)
+        known = raw.index.isin(self.df.index)
+        lacking = ~known & ~cols.all(axis=1).to_numpy()
+        if lacking.any():
+            raise ValueError(
+                f'Key columns missing: {list(raw.index[lacking])} need '
+                f'{self.keys}'
+            )
+        # given key cells over the current ones, rendered as given
+        current = self.df[self.keys].astype(object).reindex(raw.index)
+        values = current.mask(cols, raw.reindex(columns=self.keys))
+        rendered = composite_key(values, self.keys)
+        moved = rendered.to_numpy() != raw.index.astype(str).to_numpy()
+        if moved.any():
+            raise ValueError(
+                f'Key columns of {list(raw.index[moved])} render to '
+                f'{list(rendered[moved])}, delete and upsert to re-key'
+            )
+
+    def _writes(
+        self, updates: DataFrame, given: DataFrame, positions: np.ndarray
+    ) -> List[Tuple[str, np.ndarray, Series]]:
+        """
+        Values of updates per column cast to the column, checked before any
+        is written. A value the column can not hold raises ValueError.
+        """
+        labels = self.df.index[positions]
+        aligned = updates.reindex(labels)
+        mask = given.reindex(labels)
+        writes = []
+        for col in updates.columns:
+            at = mask[col].to_numpy(dtype=bool)
+            if not at.any():
+                continue
+            values = aligned[col].to_numpy()[at]
+            try:
+                if values.dtype == object and is_numeric_dtype(self.df[col]):
+                    values = pd.to_numeric(values)
+                # same rules the frame applies, on a copy of the rows only
+                cast = self.df[col].iloc[positions[at]].copy()
+                cast.iloc[:] = values
+            except (TypeError, ValueError) as err:
+                raise ValueError(f'Column {col} can not hold {values}') from err
+            writes.append((col, positions[at], cast))
+        return writes
+
+    def _conform(self, inserts: DataFrame) -> DataFrame:
+        """
+        Columns of inserted rows upcast by the holes of other rows in the
+        batch (nan in an int column) back to the column dtype, if lossless
+        """
+        for col in inserts.columns:
+            dtype, values = self.df[col].dtype, inserts[col]
+            if values.dtype == dtype or values.isna().any():
+                continue
+            try:
+                cast = values.astype(dtype)
+            except (TypeError, ValueError):
+                continue
+            if cast.eq(values).all():
+                inserts[col] = cast
+        return inserts
+
+    def _write(self, col: str, positions: np.ndarray, values: Series) -> None:
+        if values.dtype == self.df[col].dtype:
+            at = self.df.columns.get_loc(col)
+            self.df.iloc[positions, at] = values.to_numpy()
+        else:
+            # nan in an int column, upcast like the frame would
+            column = self.df[col].astype(values.dtype)
+            column.iloc[positions] = values.to_numpy()
+            self.df[col] = column
+
+    def _unindex(self, positions: np.ndarray, old: DataFrame) -> None:
+        for col, index in self.indexes.items():
+            for value in pd.unique(old[col]):
+                if value not in index:
+                    continue
+                left = np.setdiff1d(index[value], positions, assume_unique=True)
+                if len(left):
+                    index[value] = left
+                else:
+                    del index[value]
+
+    def _reindex(self, positions: np.ndarray) -> None:
+        for col, index in self.indexes.items():
+            values = self.df[col].iloc[positions].reset_index(drop=True)
+            for value, at in values.groupby(values, sort=False).indices.items():
+                hits = positions[at]
+                if value in index:
+                    hits = np.union1d(index[value], hits)
+                index[value] = hits
+
+    def upsert(self, rows: Any) -> int:
+        """
+        Updates rows whose key exists and appends the others, in one batch.
+        Cells a row dict leaves out keep their values, None or nan given are
+        written; a new row gets nan for the columns it lacks. Rows are not
+        re-keyed, key columns a key => row dict gives have to match its key.
+        Every update is checked first, a failing one leaves the dataset as
+        it was. Returns the version.
+        """
+        delta, given = self._delta(rows)
+        if delta.empty:
+            return self.version
+        known = delta.index.isin(self.df.index)
+        updates, inserts = delta[known], delta[~known]
+        positions = np.flatnonzero(self.df.index.isin(updates.index))
+        writes = self._writes(updates, given[known], positions)
+        dtypes = self.df.dtypes
+
+        if len(positions):
+            old = self.df.iloc[positions]
+            for col, at, values in writes:
+                self._write(col, at, values)
+            self._unindex(positions, old)
+            self._reindex(positions)
+            self.length += self.df.iloc[positions].count() - old.count()
+            for key in updates.index:
+                self.kv.invalidate(key)
+
+        if len(inserts):
+            start = len(self.df)
+            inserts = self._conform(inserts.reindex(columns=self.df.columns))
+            self.df = pd.concat([self.df, inserts])
+            self.kv.df = self.df
+            self._reindex(np.arange(start, len(self.df)))
+            self.length += inserts.count()
+
+        if not self.df.dtypes.equals(dtypes):
+            self.schema = df_pytypes(self.df)
+        self.version += 1
+        return self.version
+
+    def delete(self, keys: Any) -> int:
+        """Drops the rows of keys, unknown keys are skipped. Returns version"""
+        keys = list(keys) if is_list_like(keys) else [keys]
+        drop = self.df.index.isin(keys)
+        if not drop.any():
+            return self.version
+        positions = np.flatnonzero(drop)
+        self.length -= self.df.iloc[positions].count()
+        self.df = self.df[~drop]
+        self.kv.df = self.df
+        for key in set(keys):
+            self.kv.invalidate(key)
+        # positions after a dropped row move up by the rows dropped before
+        for index in self.indexes.values():
+            for value, at in list(index.items()):
+                left = np.setdiff1d(at, positions, assume_unique=True)
+                if len(left):
+                    index[value] = left - np.searchsorted(positions, left)
+                else:
+                    del index[value]
+        self.version += 1
+        return self.version
 
     def unique(self, cols: StrOrListStr) -> List[str]:
+        """
+        Distinct composite keys of cols in order of appearance, only the
+        distinct rows are rendered
+        """
+        if isinstance(cols, str):
+            cols = [cols]
         try:
-            return list(
-                self.df[cols].astype(str).agg('|'.join, axis=1).unique()
-            )
+            distinct = self.df[cols].drop_duplicates()
         except KeyError as err:
             raise ValueError(
                 f'One of the fields {cols} not found in dataset'
             ) from err
+        # 1 and '1' are distinct rows yet render the same key
+        return list(pd.unique(composite_key(distinct, cols)))
 
 
 """
@@ -0,0 +1,10 @@
+import pytest
+
+
+@pytest.fixture(scope='session', autouse=True)
+def cache_dir(tmp_path_factory: pytest.TempPathFactory):
+    """Blueprint cache of the run, the real ~/.cache/xds is left alone"""
+    with pytest.MonkeyPatch.context() as patch:
+        path = tmp_path_factory.mktemp('xds-cache')
+        patch.setenv('XDS_CACHE_DIR', str(path))
+        yield path
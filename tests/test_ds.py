@@ -0,0 +1,194 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from refactor.ds import DS
+
+
+@pytest.fixture
+def books() -> pd.DataFrame:
+    return pd.DataFrame(
+        {
+            'Book Id': [1, 2, 3, 4],
+            'Shelf': ['x', 'x', 'y', 'z'],
+            'Title': ['Dune', 'Emma', 'Ulysses', 'Beloved'],
+            'Price': [9.5, 4.0, 12.25, 7.0],
+        }
+    )
+
+
+def test_lazy_rows(books: pd.DataFrame) -> None:
+    ds = DS(books, keys='Book Id', row_cache=2)
+    assert not hasattr(ds, '_odf')
+    assert ds['3'] == {
+        'book_id': 3,
+        'shelf': 'y',
+        'title': 'Ulysses',
+        'price': 12.25,
+    }
+    assert type(ds['3']['book_id']) is int
+    assert ds['nope'] == {}
+    assert list(ds.kv) == ['1', '2', '3', '4']
+    assert len(ds.kv) == len(books)
+    for key in ('1', '2', '4'):
+        assert ds[key]['book_id'] == int(key)
+    assert len(ds.kv._rows) == ds.row_cache
+
+    price = 5.5
+    ds['2'] = {'price': price}
+    assert ds['2']['price'] == price
+    assert ds.df.loc['2', 'price'] == price
+
+
+def test_keep_source(books: pd.DataFrame) -> None:
+    ds = DS.create(source=books, keys=['Shelf', 'Book Id'], keep_source=True)
+    assert list(ds._odf.columns) == ['book_id', 'shelf', 'title', 'price']
+    assert ds['x|2']['title'] == 'Emma'
+    assert 'Book Id' in books.columns
+
+
+def test_kv_search_index(books: pd.DataFrame) -> None:
+    plain = DS(books, keys='Book Id')
+    ds = DS(books, keys='Book Id', index='Shelf,book_id')
+    assert set(ds.indexes) == {'shelf', 'book_id'}
+    queries = [
+        {'shelf': 'x'},
+        {'shelf': 'x,z'},
+        {'shelf': ['y', 'z'], 'price': [7.0, 12.25]},
+        {'shelf': 'x', 'book_id': 2},
+        {'shelf': 'x', 'book_id': 3},
+        {'shelf': 'nope'},
+        {'title': 'Emma', 'unknown': 1},
+    ]
+    for query in queries:
+        expected = plain.kv_search(query)
+        pd.testing.assert_frame_equal(ds.kv_search(query), expected)
+    assert list(ds.kv_search({'shelf': 'x'}).index) == ['1', '2']
+
+    ds['3'] = {'shelf': 'x'}
+    assert list(ds.kv_search({'shelf': 'x'}).index) == ['1', '2', '3']
+    with pytest.raises(ValueError, match='Unknown index'):
+        DS(books, index='Genre')
+
+
+def test_composite_keys(books: pd.DataFrame) -> None:
+    books['Shelf'] = books['Shelf'].astype(object)
+    books.loc[3, 'Shelf'] = None
+    ds = DS(books, keys='Shelf,Book Id')
+    assert list(ds.df.index) == ['x|1', 'x|2', 'y|3', 'nan|4']
+    assert ds.unique('shelf') == ['x', 'y', 'nan']
+    assert ds.unique(['shelf', 'price']) == [
+        'x|9.5',
+        'x|4.0',
+        'y|12.25',
+        'nan|7.0',
+    ]
+    with pytest.raises(ValueError, match='not found'):
+        ds.unique(['genre'])
+
+
+def test_nested_children(books: pd.DataFrame) -> None:
+    books['Loans'] = [
+        pd.DataFrame({'Member': ['ann', 'bob'], 'Days': [3, 5]}),
+        pd.DataFrame({'Member': ['cy'], 'Days': [1]}),
+        pd.DataFrame({'Member': ['ann'], 'Days': [7]}),
+        pd.DataFrame({'Member': ['dee'], 'Days': [2]}),
+    ]
+    ds = DS(books, keys='Book Id', children={'Loans': {'keys': 'Member'}})
+    assert ds.schema == {
+        'book_id': 'int',
+        'shelf': 'str',
+        'title': 'str',
+        'price': 'float',
+    }
+    loans = ds.children['loans']
+    assert loans['3|ann'] == {'member': 'ann', 'days': 7, 'pkey': '3'}
+    assert loans.schema['days'] == 'int'
+
+
+def test_upsert_delete(books: pd.DataFrame) -> None:
+    ds = DS(books, keys='Book Id', index='shelf')
+    assert ds.version == 0
+    ds['1']
+    versions = [
+        ds.upsert(
+            [
+                {'Book Id': 1, 'Price': 10.0},
+                {'Book Id': 5, 'Shelf': 'x', 'Title': 'Kim', 'Price': 3.0},
+            ]
+        )
+    ]
+    assert ds['1'] == {
+        'book_id': 1,
+        'shelf': 'x',
+        'title': 'Dune',
+        'price': 10.0,
+    }
+    assert ds['5']['title'] == 'Kim'
+    assert list(ds.kv_search({'shelf': 'x'}).index) == ['1', '2', '5']
+    assert ds.length['title'] == len(books) + 1
+
+    versions.append(ds.upsert({'2': {'shelf': 'z'}}))
+    versions.append(ds.delete(['1', 'nope']))
+    assert ds['1'] == {}
+    assert list(ds.kv) == ['2', '3', '4', '5']
+    assert ds.length['title'] == len(books)
+    for shelf in ('x', 'y', 'z'):
+        fresh = DS(ds.df.reset_index(drop=True), keys='book_id')
+        pd.testing.assert_frame_equal(
+            ds.kv_search({'shelf': shelf}),
+            fresh.kv_search({'shelf': shelf}),
+            check_index_type=False,
+        )
+    versions.append(ds.delete('nope'))
+    with pytest.raises(ValueError, match='Unknown columns'):
+        ds.upsert([{'book_id': 6, 'genre': 'sf'}])
+
+    ds['2'] = {'price': None}
+    assert np.isnan(ds['2']['price'])
+    versions.append(ds.delete(np.array(['2'])))
+    versions.append(ds.delete(pd.Index(['3'])))
+    assert list(ds.kv) == ['4', '5']
+    assert versions == [1, 2, 3, 3, 5, 6]
+
+
+def test_upsert_failed(books: pd.DataFrame) -> None:
+    ds = DS(books, keys='Book Id', index='shelf')
+    length = ds.length.copy()
+    with pytest.raises(ValueError, match='can not hold'):
+        ds.upsert({'1': {'price': 1.0}, '2': {'price': 'cheap'}})
+    assert ds.version == 0
+    assert ds['1']['price'] == books.loc[0, 'Price']
+    assert list(ds.kv_search({'shelf': 'x'}).index) == ['1', '2']
+    pd.testing.assert_series_equal(ds.length, length)
+
+    ds.upsert([{'Book Id': 1, 'Shelf': 'y'}, {'Book Id': 2, 'Price': 1.0}])
+    assert ds['2'] == {
+        'book_id': 2,
+        'shelf': 'x',
+        'title': 'Emma',
+        'price': 1.0,
+    }
+    assert list(ds.kv_search({'shelf': 'y'}).index) == ['1', '3']
+
+
+def test_upsert_keys(books: pd.DataFrame) -> None:
+    ds = DS(books, keys='Book Id', index='shelf')
+    with pytest.raises(ValueError, match='Key missing'):
+        ds['9'] = {'title': 'Kim'}
+    with pytest.raises(ValueError, match='Key columns missing'):
+        ds.upsert({'9': {'title': 'Kim'}})
+    with pytest.raises(ValueError, match='render to'):
+        ds.upsert({'1': {'book_id': 5}})
+    with pytest.raises(ValueError, match='render to'):
+        ds.upsert({'9': {'book_id': 5, 'title': 'Kim'}})
+    assert ds.version == 0
+    assert list(ds.kv) == ['1', '2', '3', '4']
+    assert ds['1']['book_id'] == 1
+
+    price, book_id = 1.0, 9
+    ds.upsert({'1': {'price': price}, str(book_id): {'book_id': book_id}})
+    assert ds['1']['price'] == price
+    assert ds[str(book_id)]['book_id'] == book_id
+    assert ds.schema['book_id'] == 'int'
+    assert list(ds.kv) == ['1', '2', '3', '4', '9']
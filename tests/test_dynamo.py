@@ -1,11 +1,19 @@
+import re
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from types import SimpleNamespace
 from typing import Any, Dict
 
 import attr
+import numpy as np
 import pytest
 from icecream import ic
 
+from xds.core.blueprint import BlueprintCache, parse_blueprint
 from xds.core.dynamo import Dynamo
+from xds.core.field import field_spec
+from xds.core.graph import ModelGraph
+from xds.core.query import conforming
 from xds.core.registry import Registry
 from xds.utils.helpers import flat, io_stream, read_yaml
 from xds.utils.logger import log
@@ -143,3 +151,353 @@ def test_so_complex(setup: Dict[str, Any]) -> None:
     # ic(flt)
     _adhoc_cls(setup, 'complex')
     _adhoc_instance(setup, 'complex')
+
+
+def test_class_cache(setup: Dict[str, Any]) -> None:
+    factory = setup['factory']
+    cls = factory.d2c(content=setup['nested'])
+    assert factory.d2c(content=setup['nested']) is cls
+    shared = """
+    kind: Shared
+    left:
+      kind: Point
+      x: 1
+      y: 2
+    right:
+      kind: Point
+      x: 1
+      y: 2
+    """
+    scls = factory.d2c(content=shared)
+    fields = attr.fields_dict(scls)
+    assert fields['left'].type is fields['right'].type
+
+
+def test_compiled_hooks(setup: Dict[str, Any]) -> None:
+    factory = setup['factory']
+    factory.d2c(
+        content="""
+        kind: Typed
+        Port: int=22
+        tags: lists=a,b
+        since: date
+        """
+    )
+    port = 2222
+    inst = factory.instance(
+        content=f'kind: Typed\nPort: "{port}"\ntags: x,y\nsince: "2024-11-10"'
+    )
+    assert inst.port == port
+    assert inst.tags == ['x', 'y']
+    assert str(inst.since) == '2024-11-10'
+    raw = factory.serializer.unstructure(inst)
+    assert raw['Port'] == port
+    assert 'port' not in raw
+    assert factory.instance(kind='Typed', port=port).port == port
+    assert factory.instance(kind='Typed', Port=str(port)).port == port
+
+
+def test_instances_many(setup: Dict[str, Any]) -> None:
+    registry = setup['registry']
+    records = ({'ns': f'bulk{i}', 'api': 'api/v3'} for i in range(3))
+    insts = list(registry.instances_many(records, kind='Env'))
+    assert [i.ns for i in insts] == ['bulk0', 'bulk1', 'bulk2']
+    assert all(i.kind == 'Env' for i in insts)
+    assert registry.locator('instances/env/bulk2') is insts[2]
+    assert list(registry.factory.instances_many([])) == []
+
+
+def test_lazy_models(setup: Dict[str, Any], tmp_path: Path) -> None:
+    registry = setup['registry']
+    (tmp_path / 'rack.yaml').write_text('kind: Shelving\nns: str\n')
+    registry.pending['rack'] = tmp_path / 'rack.yaml'
+    pending = dict(registry.pending)
+    assert registry.locator('models/nosuch') is None
+    assert registry.pending == pending
+    assert registry.model('Shelving') is registry.models['shelving']
+    assert 'rack' not in registry.pending
+    assert registry.model('Query') is registry.models['query']
+    assert 'query' not in registry.pending
+    registry.preload(background=True).join()
+    assert not registry.pending
+    assert registry.model('Enumeration') is not None
+
+
+def test_blueprint_cache(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    bfile = tmp_path / 'typed.yaml'
+    bfile.write_text('kind: Cached\nport: int=22\nremote: xref=Env\n')
+    cache = BlueprintCache(str(tmp_path / 'cache'))
+    compiled = cache.load(bfile)
+    assert compiled.kind == 'Cached'
+    assert compiled.specs['int=22'] == field_spec('int=22')
+    assert compiled.xrefs == {'Env'}
+
+    def _no_parse(**kwargs: Any) -> None:
+        raise AssertionError('blueprint re-parsed')
+
+    monkeypatch.setattr('xds.core.blueprint.parse_blueprint', _no_parse)
+    assert cache.load(bfile) == compiled
+    bfile.touch()
+    assert cache.load(bfile) == compiled
+    bfile.write_text('kind: Cached\nport: int=23\n')
+    with pytest.raises(AssertionError):
+        cache.load(bfile)
+
+    monkeypatch.undo()
+    kept = tmp_path / 'kept.yaml'
+    kept.write_text('kind: Kept\n')
+    cache.load(kept)
+    bfile.unlink()
+    assert cache.prune() == 1
+    assert [e.name for e in cache.root.iterdir()] == [
+        cache._entry_path(kept).name
+    ]
+    assert cache.clear() == 1
+
+
+def test_locator_index(
+    setup: Dict[str, Any], monkeypatch: pytest.MonkeyPatch
+) -> None:
+    registry = setup['registry']
+    inst = registry.instance(content='kind: Env\nns: leafy')
+    assert registry.locator('instances/env/leafy') is inst
+    assert registry.locator('instances/nokind/LEAFY') is inst
+    assert 'instances/env/leafy' in registry.leaves['leafy']
+    registry.factory.d2c(content='kind: Leaf\nns: str')
+    twin = registry.instance(content='kind: Leaf\nns: leafy')
+    assert registry.locator('instances/leaf/leafy') is twin
+    assert registry.locator('instances/nokind/leafy') is None
+
+    leaves = registry.leaves
+    late = type(twin)(ns='late')
+
+    def racing(leaf: str, default: Any = None) -> Any:
+        # the lookup misses, then a registration lands before it is memoized
+        found = leaves.get(leaf, default)
+        monkeypatch.setattr(registry, 'leaves', leaves)
+        registry.register(late)
+        return found
+
+    monkeypatch.setattr(registry, 'leaves', SimpleNamespace(get=racing))
+    assert registry.locator('instances/leaf/late') is None
+    assert registry.locator('instances/leaf/late') is late
+
+
+def test_concurrent_register(setup: Dict[str, Any]) -> None:
+    registry = setup['registry']
+    factory = registry.factory
+    leaf = factory.d2c(content='kind: Leaf\nns: str')
+    objs = [leaf(ns=f'thread{i % 50}') for i in range(400)]
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        registered = list(pool.map(registry.register, objs))
+    for i, obj in enumerate(registered):
+        assert obj is registered[i % 50]
+        assert registry.locator(f'instances/leaf/thread{i % 50}') is obj
+    assert Registry() is registry
+
+
+def test_parallel_preload(setup: Dict[str, Any]) -> None:
+    registry = setup['registry']
+    bdir = Path('tests/fixtures/blueprints')
+    registry.pending['b'] = bdir / 'b.yaml'
+    registry.pending['a'] = bdir / 'a.yaml'
+    registry.workers = 2
+    try:
+        registry.preload()
+    finally:
+        registry.workers = 0
+    assert not registry.pending
+    assert not registry.compiled
+    fields = attr.fields_dict(registry.model('B'))
+    assert fields['a'].type is registry.model('A')
+
+
+def test_conforming(setup: Dict[str, Any]) -> None:
+    factory = setup['factory']
+    cls = factory.d2c(content='kind: Order\nqty: int#ge=10\nside: str#in=B,S')
+    orders = [cls(qty=q, side=s) for q, s in [(5, 'B'), (15, 'S'), (20, 'X')]]
+    assert [o.qty for o in conforming(orders, cls)] == [15]
+
+
+def test_compact_classes(setup: Dict[str, Any]) -> None:
+    registry = setup['registry']
+    factory = setup['factory']
+    factory.compact = factory.frozen = True
+    try:
+        cls = factory.d2c(content='kind: Compact\nns: str\nqty: int=1')
+        obj = factory.instance(content='kind: Compact\nns: tight\nqty: 3')
+    finally:
+        factory.compact = factory.frozen = False
+    assert not hasattr(obj, '__dict__')
+    assert (obj.ns, obj.qty) == ('tight', 3)
+    with pytest.raises(attr.exceptions.FrozenInstanceError):
+        obj.qty = 4
+    assert registry.register(obj).nsid == 'instances/compact/tight'
+
+    class Impl:
+        def __init__(self, **kwargs: Any) -> None:
+            self.extra = 'proxied'
+
+    cls.proxy = Impl
+    factory.compact = True
+    try:
+        obj = factory.instance(content='kind: Compact\nns: proxied')
+    finally:
+        factory.compact = False
+    assert obj.extra == 'proxied'
+    with pytest.raises(AttributeError):
+        _ = obj.missing
+
+    def impl(**kwargs: Any) -> Impl:
+        return Impl(**kwargs)
+
+    factory.compact = True
+    try:
+        cls.proxy = impl
+        obj = factory.instance(content='kind: Compact\nns: made')
+        assert obj.extra == 'proxied'
+        cls.proxy = 'Impl'
+        with pytest.raises(ValueError, match='class or a factory'):
+            factory.instance(content='kind: Compact\nns: bad')
+    finally:
+        factory.compact = False
+        del cls.proxy
+
+
+def test_column_store(setup: Dict[str, Any]) -> None:
+    registry = setup['registry']
+    factory = setup['factory']
+    factory.d2c(content='kind: Trade\nns: str\ndesk: str\nqty: int#ge=10')
+    records = [
+        {'ns': f't{i}', 'desk': 'fx' if i % 2 else 'rates', 'qty': i * 5}
+        for i in range(6)
+    ]
+    list(registry.instances_many(records, kind='Trade'))
+    store = registry.columns('Trade')
+    assert len(store) == len(records)
+    assert store['qty'].dtype == np.int64
+    row = {r.ns: r for r in store}['t3']
+    assert row.qty == records[3]['qty']
+    assert row.to_obj() == registry.locator('instances/trade/t3')
+    assert sorted(r.ns for r in store.conforming()) == ['t2', 't3', 't4', 't5']
+    assert sorted(r.ns for r in store.filter(qty='gt=10', desk='in=fx')) == [
+        't3',
+        't5',
+    ]
+    assert store.aggregate('qty') == sum(r['qty'] for r in records)
+    assert store.aggregate('qty', 'sum', by='desk') == {'rates': 30, 'fx': 45}
+
+
+def test_instances_many_file(setup: Dict[str, Any], tmp_path: Path) -> None:
+    registry = setup['registry']
+    envs = tmp_path / 'envs.jsonl'
+    envs.write_text('{"kind": "Env", "ns": "s1"}\n{"ns": "s2"}\n')
+    insts = list(registry.instances_many(file=envs))
+    assert [i.ns for i in insts] == ['s1', 's2']
+    assert registry.locator('instances/env/s2') is insts[1]
+
+
+def test_hot_reload(setup: Dict[str, Any], tmp_path: Path) -> None:
+    registry = setup['registry']
+    book = tmp_path / 'book.yaml'
+    book.write_text('kind: Book\nns: str\ntitle: str\nauthor: str\n')
+    (tmp_path / 'shelf.yaml').write_text(
+        'kind: Shelf\nns: str\nbook: xref=Book\n'
+    )
+    registry.pending['book'] = book
+    registry.pending['shelf'] = tmp_path / 'shelf.yaml'
+    shelf_cls = registry.model('Shelf')
+    conf = tmp_path / 'shelf1.yaml'
+    conf.write_text('kind: Shelf\nns: s1\nbook:\n  ns: b1\n  title: T\n')
+    shelf = registry.instance(file=conf)
+    assert registry.reload() == []
+
+    book.write_text(
+        'kind: Book\nns: str\ntitle: str\nauthor: str\npages: int=100\n'
+    )
+    reloaded = registry.reload()
+    expected = {'models/book', 'models/shelf', 'instances/shelf/s1'}
+    assert expected <= set(reloaded)
+    new_shelf = registry.obj('instances/shelf/s1')
+    assert registry.model('Shelf') is not shelf_cls
+    assert type(new_shelf) is registry.model('Shelf')
+    assert new_shelf is not shelf
+    assert (new_shelf.book.title, new_shelf.book.pages) == ('T', 100)
+    assert new_shelf.book.author is None
+
+    conf.write_text('kind: Shelf\nns: s1\nbook:\n  ns: b1\n  title: Changed\n')
+    assert registry.reload() == ['instances/shelf/s1']
+    assert registry.obj('instances/shelf/s1').book.title == 'Changed'
+
+
+def test_model_graph(setup: Dict[str, Any], tmp_path: Path) -> None:
+    def blueprints(**contents: str) -> Dict[str, Any]:
+        return {m: parse_blueprint(content=c) for m, c in contents.items()}
+
+    graph = ModelGraph.from_blueprints(
+        blueprints(
+            c='kind: C\nb: xref=B\nleaf:\n  a: xref=A\n',
+            b='kind: B\nx: xref=Known\n',
+            a='kind: A\nv: str\n',
+            d='kind: D\nv: str\n',
+        ),
+        known=['Known'],
+    ).check()
+    assert graph.levels() == [['b', 'a', 'd'], ['c']]
+
+    cyclic = ModelGraph.from_blueprints(
+        blueprints(
+            a='kind: A\nb: xref=B\n',
+            b='kind: B\nc: xref=C\n',
+            c='kind: C\nb: xref=B\n',
+        )
+    )
+    with pytest.raises(ValueError, match='b -> c -> b'):
+        cyclic.order()
+    orphan = ModelGraph.from_blueprints(blueprints(a='kind: A\nz: xref=Zed\n'))
+    with pytest.raises(ValueError, match=re.escape("a => ['Zed']")):
+        orphan.check()
+
+    registry = setup['registry']
+    (tmp_path / 'orphan.yaml').write_text('kind: Orphan\nz: xref=Zed\n')
+    registry.pending['orphan'] = tmp_path / 'orphan.yaml'
+    try:
+        with pytest.raises(ValueError, match='Zed'):
+            registry.preload()
+        with pytest.raises(ValueError, match=re.escape('Orphan.z xrefs Zed')):
+            registry.model('Orphan')
+    finally:
+        registry.pending.pop('orphan')
+        registry.compiled.pop('orphan', None)
+
+
+def test_metrics(setup: Dict[str, Any]) -> None:
+    registry = setup['registry']
+    registry.factory.d2c(content='kind: Leaf\nns: str')
+    rows = [{'ns': 'm1'}, {'ns': 'm2'}]
+    list(registry.instances_many(rows, kind='Leaf'))
+    registry.locator('instances/nope/m2')
+    snap = registry.metrics()
+    assert snap['counters']['instances_total{kind="Leaf"}'] >= len(rows)
+    assert snap['counters']['lookups_total{result="fuzzy"}'] >= 1
+    structure = snap['histograms']['structure_seconds{kind="Leaf"}']
+    assert structure['count'] >= len(rows)
+    assert structure['buckets'][float('inf')] == structure['count']
+    assert 'build_seconds{model="Env"}' in snap['histograms']
+    assert 0 < snap['ratios']['cache_hit_ratio{cache="field_spec"}'] <= 1
+    assert snap['gauges']['instances'] == len(registry.instances)
+
+    text = registry.metrics_text()
+    assert '# TYPE xds_structure_seconds histogram' in text
+    assert 'xds_structure_seconds_bucket{kind="Leaf",le="+Inf"}' in text
+    assert 'xds_cache_hits_total{cache="locator"}' in text
+
+
+def test_key_modifier(setup: Dict[str, Any]) -> None:
+    factory = setup['registry'].factory
+    factory.d2c(content='kind: Keyed\nns: str#key\nTrade Id: int#key')
+    obj = factory.instance(kind='Keyed', ns='k1', **{'Trade Id': '7'})
+    assert (obj.ns, obj.trade_id) == ('k1', 7)
+    assert factory.serializer.unstructure(obj)['Trade Id'] == obj.trade_id
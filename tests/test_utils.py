@@ -1,12 +1,23 @@
+import json
+import pickle
 import typing
-from datetime import datetime
-from typing import Any, Dict
+from datetime import date, datetime
+from pathlib import Path
+from typing import Any, Dict, List
 
+import numpy as np
+import pandas as pd
 import pytest
+import yaml
 from icecream import ic
+from loguru import logger
 
 from xds.core.field import field_spec
+from xds.core.query import predicate
+from xds.utils import helpers
 from xds.utils.dates import date_modifier
+from xds.utils.helpers import df_pytypes, input_records
+from xds.utils.logger import log
 
 
 @pytest.fixture(scope='module')
@@ -113,6 +124,191 @@ def test_fld_spec(data: Dict[str, Any]) -> None:
     for spec, expected in data['fldspecs']:
         results = field_spec(spec)
         ic(spec, results)
-        assert (
-            results == expected
-        ), f'Failed on {spec}:Expected {expected}, Got {results}'
+        assert results == expected, (
+            f'Failed on {spec}:Expected {expected}, Got {results}'
+        )
+
+
+def test_fld_spec_memo() -> None:
+    spec = field_spec('int=42#req#in=1,2')
+    assert field_spec('int=42#req#in=1,2') is spec
+    with pytest.raises(TypeError):
+        spec['req'] = False
+    assert pickle.loads(pickle.dumps(spec)) == spec
+    assert field_spec('regex=a#interval=5') == {'type': str}
+    with pytest.raises(ValueError, match='gt must have a value'):
+        field_spec('int#gt')
+    with pytest.raises(ValueError, match='Only one type'):
+        field_spec('int#float')
+
+
+def test_fld_spec_values() -> None:
+    assert field_spec('bool=false')['default'] is False
+    assert field_spec('listb=yes,no')['default'] == [True, False]
+    assert field_spec('date=2024-01-02')['default'] == date(2024, 1, 2)
+    assert field_spec('dt#in=2024-01-02T10:00')['in'] == [
+        datetime(2024, 1, 2, 10)
+    ]
+    with pytest.raises(ValueError, match='Not a bool'):
+        field_spec('bool=maybe')
+
+
+def test_predicates() -> None:
+    rule = predicate(field_spec('int#gt=5#le=10'))
+    assert rule(7)
+    assert not rule(5)
+    assert not rule(None)
+    mask = rule(np.array([4, 6, 10, 11]))
+    assert mask.tolist() == [False, True, True, False]
+    names = predicate(field_spec('str#start=ab#in=abc,abd,xyz'))
+    assert names('abd')
+    assert names(pd.Series(['abc', 'abd', 'xyz', None])).tolist() == [
+        True,
+        True,
+        False,
+        False,
+    ]
+    tags = predicate(field_spec('lists#has=x'))
+    assert tags(pd.Series([['x', 'y'], ['y'], []])).tolist() == [
+        True,
+        False,
+        False,
+    ]
+    assert predicate(field_spec('float#range=1,2'))(1.5)
+
+    since = predicate(field_spec('date#ge=2024-01-01'))
+    assert since.rules == (('ge', date(2024, 1, 1)),)
+    assert since(date(2024, 2, 1))
+    assert not since(date(2023, 12, 31))
+    days = np.array(['2024-02-01', '2023-12-31', 'NaT'], dtype='datetime64[D]')
+    assert since(days).tolist() == [True, False, False]
+    window = predicate(field_spec('dt#range=2024-01-01,2024-01-02T12:00'))
+    assert window(datetime(2024, 1, 2, 6))
+    off = predicate(field_spec('bool#eq=false'))
+    assert off.rules == (('eq', False),)
+    assert off(pd.Series([True, False])).tolist() == [False, True]
+
+
+def test_input_records(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(helpers, '_JSON_CHUNK', 7)
+    rows = [
+        {'ns': f'r{i}', 'qty': 1234567 * i, 'tags': ['a', 'b']}
+        for i in range(5)
+    ]
+    (tmp_path / 'rows.json').write_text(json.dumps(rows, indent=1))
+    (tmp_path / 'rows.jsonl').write_text(
+        '\n'.join(json.dumps(r) for r in rows) + '\n'
+    )
+    (tmp_path / 'rows.yaml').write_text(
+        '\n---\n'.join(yaml.safe_dump(r) for r in rows[:2])
+        + '\n---\n'
+        + yaml.safe_dump(rows[2:])
+    )
+    (tmp_path / 'empty.json').write_text(' [ ] ')
+    for name in ('rows.json', 'rows.jsonl', 'rows.yaml'):
+        assert list(input_records(file=tmp_path / name)) == rows, name
+    assert list(input_records(file=tmp_path / 'empty.json')) == []
+    (tmp_path / 'bad.json').write_text('[{"a": 1} {"b": 2}]')
+    with pytest.raises(ValueError, match='Malformed'):
+        list(input_records(file=tmp_path / 'bad.json'))
+
+
+def test_yaml_backend(monkeypatch: pytest.MonkeyPatch) -> None:
+    doc = 'kind: Env\nqty: 10\ntags: [a, b]\nwhen: 2024-01-02\n'
+    expected = yaml.safe_load(doc)
+    monkeypatch.setattr(helpers, 'yaml_backend', helpers.YamlBackend())
+    monkeypatch.setenv('XDS_YAML_LOADER', 'python')
+    assert helpers.yaml_loader() is yaml.SafeLoader
+    assert helpers.read_yaml(doc) == expected
+    if yaml.__with_libyaml__:
+        assert helpers.set_yaml_backend('auto') is yaml.CSafeLoader
+        assert helpers.read_yaml(doc) == expected
+    with pytest.raises(ValueError, match='Unknown'):
+        helpers.set_yaml_backend('rust')
+
+
+def test_file_cache(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    cache = helpers.FileCache(max_bytes=64, mmap_min=16)
+    small, big = tmp_path / 'small.yaml', tmp_path / 'big.yaml'
+    small.write_text('a: 1\r\n')
+    big.write_text('b: ' + 'x' * 40 + '\n')
+    assert cache.read(small) == 'a: 1\n'
+    assert cache.read(small) is cache.read(small)
+    assert cache.read(big) == big.read_text()
+    small.write_text('a: 333\n')
+    assert cache.read(small) == 'a: 333\n'
+    big.write_text('b: ' + 'y' * 70 + '\n')
+    assert cache.read(big).startswith('b: yyy')
+    assert cache.size <= cache.max_bytes
+
+    monkeypatch.setattr(helpers, '_MISSING', {})
+    late = tmp_path / 'late.yaml'
+    with pytest.raises(FileNotFoundError):
+        helpers.io_path(file='late.yaml', dir=tmp_path)
+    late.write_text('c: 3\n')
+    with pytest.raises(FileNotFoundError):
+        helpers.io_path(file='late.yaml', dir=tmp_path)
+    helpers.io_cache_clear()
+    assert helpers.io_path(file='late.yaml', dir=tmp_path) == late
+
+    monkeypatch.setattr(helpers, '_MISSING_MAX', 3)
+    for i in range(5):
+        with pytest.raises(FileNotFoundError):
+            helpers.io_path(file=f'none{i}.yaml', dir=tmp_path)
+    assert [k[1] for k in helpers._MISSING] == [
+        'none2.yaml',
+        'none3.yaml',
+        'none4.yaml',
+    ]
+    helpers._MISSING.clear()
+    monkeypatch.setattr(helpers, '_MISSING_TTL', 0)
+    for name in ('gone.yaml', 'left.yaml'):
+        with pytest.raises(FileNotFoundError):
+            helpers.io_path(file=name, dir=tmp_path)
+    assert list(helpers._MISSING) == [(str(tmp_path), 'left.yaml')]
+
+
+def test_log_levels() -> None:
+    def boom() -> str:
+        raise AssertionError('formatted while disabled')
+
+    seen: List[str] = []
+    sink = logger.add(lambda m: seen.append(m.record['message']), level=0)
+    level = log.level
+    try:
+        log.set_level('INFO')
+        assert log.enabled('ERROR')
+        assert not log.enabled('DEBUG')
+        log.debug(boom)
+        log.debug('never {}', boom)
+        log.info('built {} of {}', lambda: 'Book', 'shelf')
+        log.info('raw {braces} kept')
+        assert seen == ['built Book of shelf', 'raw {braces} kept']
+    finally:
+        log.set_level(level)
+        logger.remove(sink)
+
+
+def test_df_pytypes() -> None:
+    df = pd.DataFrame(
+        {
+            'qty': np.array([1, 2], dtype=np.int32),
+            'px': [1.5, np.nan],
+            'ok': [True, False],
+            'name': [None, 'b'],
+            'when': [datetime(2024, 1, 1).date(), None],
+            'nested': [pd.DataFrame(), pd.DataFrame()],
+            'tags': [['a'], ['b']],
+        }
+    )
+    expected = {
+        'qty': 'int',
+        'px': 'float',
+        'ok': 'bool',
+        'name': 'str',
+        'when': 'date',
+        'nested': 'pd',
+        'tags': 'list',
+    }
+    assert df_pytypes(df) == expected
+    assert df_pytypes(df.iloc[:0])['qty'] == 'int'
@@ -0,0 +1,219 @@
+import hashlib
+import os
+import pickle
+from pathlib import Path
+from typing import Any, Dict, Optional, Set
+
+import attr
+
+from xds.core.field import field_spec
+from xds.utils.helpers import input_dict
+from xds.utils.logger import log
+from xds.utils.metrics import metrics
+
+DYNAMIC_CLASS = 'DynamicClass'
+
+# Bump when the pickled layout or the field_spec output changes
+_CACHE_VERSION = 3
+
+
+@attr.s(frozen=True, slots=True)
+class Blueprint:
+    """
+    Normalized blueprint, kinds injected, along with the field spec of every
+    string leaf Dynamo turns into a field. Enough to build the classes
+    without yaml parsing or modifier parsing.
+    """
+
+    kind = attr.ib(type=str)
+    data = attr.ib(type=dict)
+    specs = attr.ib(type=dict)
+
+    @property
+    def xrefs(self) -> Set[str]:
+        return {
+            spec['xref'] for spec in self.specs.values() if spec.get('xref')
+        }
+
+    @property
+    def kinds(self) -> Set[str]:
+        """Kinds of the classes built out of it, nested ones included"""
+        return _kinds(self.data, set())
+
+
+def _kinds(data: Any, kinds: Set[str]) -> Set[str]:
+    if isinstance(data, dict):
+        if isinstance(data.get('kind'), str):
+            kinds.add(data['kind'])
+        for value in data.values():
+            _kinds(value, kinds)
+    elif isinstance(data, list) and data:
+        _kinds(data[0], kinds)
+    return kinds
+
+
+def with_kinds(key: str, data: Any) -> Any:
+    if isinstance(data, dict):
+        if 'kind' not in data:
+            data['kind'] = key
+        for k, value in data.items():
+            with_kinds(k, value)
+    elif isinstance(data, list):
+        for item in data:
+            with_kinds(key, item)
+    return data
+
+
+def field_specs(
+    data: Dict[str, Any], specs: Optional[Dict[str, Any]] = None
+) -> Dict[str, Any]:
+    """
+    Field spec per string leaf, walking the same nodes Dynamo._from_data
+    does: nested dicts and the first dict of a list
+    """
+    if specs is None:
+        specs = {}
+    for value in data.values():
+        if isinstance(value, dict):
+            field_specs(value, specs)
+        elif isinstance(value, list):
+            if value and isinstance(value[0], dict):
+                field_specs(value[0], specs)
+        elif isinstance(value, str) and value not in specs:
+            specs[value] = field_spec(value)
+    return specs
+
+
+def parse_blueprint(**kwargs: Any) -> Blueprint:
+    data = with_kinds(DYNAMIC_CLASS, input_dict(**kwargs))
+    return Blueprint(
+        kind=data.get('kind', DYNAMIC_CLASS),
+        data=data,
+        specs=field_specs(data),
+    )
+
+
+def compile_blueprint(file: Any, cache_dir: Optional[str] = None) -> Blueprint:
+    """
+    Module level so it can run in a process pool worker
+    """
+    return BlueprintCache(cache_dir).load(file)
+
+
+def _digest(raw: bytes) -> str:
+    return hashlib.blake2b(raw, digest_size=16).hexdigest()
+
+
+class BlueprintCache:
+    """
+    Compiled blueprints pickled on disk, one entry per blueprint path. An
+    entry is trusted as long as the file mtime and size are unchanged, else
+    the content hash decides whether it is re-parsed.
+
+    Location is XDS_CACHE_DIR (default ~/.cache/xds), XDS_CACHE=0 disables it.
+    Entries of blueprints deleted or moved since are dropped by prune(),
+    clear() drops them all:
+
+        python -m xds.core.blueprint prune|clear [cache dir]
+    """
+
+    def __init__(self, root: Optional[str] = None) -> None:
+        self.root = Path(
+            root
+            or os.getenv('XDS_CACHE_DIR')
+            or Path.home() / '.cache' / 'xds'
+        )
+        self.enabled = os.getenv('XDS_CACHE', '1') != '0'
+
+    def load(self, file: Any) -> Blueprint:
+        path = Path(file)
+        if not self.enabled:
+            return parse_blueprint(file=path)
+        stat = path.stat()
+        entry_path = self._entry_path(path)
+        entry = self._read(entry_path)
+        if (
+            entry
+            and entry['mtime'] == stat.st_mtime_ns
+            and entry['size'] == stat.st_size
+        ):
+            metrics.incr('cache_hits_total', cache='blueprint')
+            return entry['blueprint']
+
+        digest = _digest(path.read_bytes())
+        if entry and entry['digest'] == digest:
+            metrics.incr('cache_hits_total', cache='blueprint')
+            blueprint = entry['blueprint']
+        else:
+            metrics.incr('cache_misses_total', cache='blueprint')
+            log.info(f'Compiling blueprint {path}')
+            blueprint = parse_blueprint(file=path)
+        self._write(
+            entry_path,
+            {
+                'version': _CACHE_VERSION,
+                'path': str(path.resolve()),
+                'mtime': stat.st_mtime_ns,
+                'size': stat.st_size,
+                'digest': digest,
+                'blueprint': blueprint,
+            },
+        )
+        return blueprint
+
+    def prune(self) -> int:
+        """
+        Drop the entries whose blueprint is gone, or that are unreadable or of
+        an older layout. Returns the number dropped.
+        """
+        dropped = 0
+        for entry_path in self.root.glob('*.pickle'):
+            entry = self._read(entry_path)
+            if entry is None or not Path(entry['path']).is_file():
+                entry_path.unlink(missing_ok=True)
+                dropped += 1
+        return dropped
+
+    def clear(self) -> int:
+        entries = list(self.root.glob('*.pickle'))
+        for entry_path in entries:
+            entry_path.unlink(missing_ok=True)
+        return len(entries)
+
+    def _entry_path(self, path: Path) -> Path:
+        key = _digest(str(path.resolve()).encode())
+        return self.root / f'{key}.pickle'
+
+    def _read(self, entry_path: Path) -> Optional[Dict[str, Any]]:
+        try:
+            with open(entry_path, 'rb') as fp:
+                entry = pickle.load(fp)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            log.warn(f'Ignoring unreadable blueprint cache {entry_path}: {e}')
+            return None
+        if entry.get('version') != _CACHE_VERSION:
+            return None
+        return entry
+
+    def _write(self, entry_path: Path, entry: Dict[str, Any]) -> None:
+        tmp = entry_path.with_suffix(f'.{os.getpid()}.tmp')
+        try:
+            self.root.mkdir(parents=True, exist_ok=True)
+            with open(tmp, 'wb') as fp:
+                pickle.dump(entry, fp, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, entry_path)
+        except Exception as e:
+            log.warn(f'Could not write blueprint cache {entry_path}: {e}')
+
+
+if __name__ == '__main__':
+    import sys
+
+    command, *root = sys.argv[1:] or ['']
+    if command not in ('prune', 'clear') or len(root) > 1:
+        sys.exit('usage: python -m xds.core.blueprint prune|clear [cache dir]')
+    cache = BlueprintCache(*root)
+    dropped = getattr(cache, command)()
+    print(f'Dropped {dropped} entries from {cache.root}')
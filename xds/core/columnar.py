@@ -0,0 +1,203 @@
+from datetime import date, datetime
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Union,
+)
+
+import attr
+import numpy as np
+import pandas as pd
+
+from xds.core.field import field_spec
+from xds.core.query import Predicate, field_predicates, predicate
+
+# Field spec / blueprint type => column dtype, anything else is object
+_DTYPES: Dict[Any, Any] = {
+    int: np.int64,
+    float: np.float64,
+    bool: np.bool_,
+    date: 'datetime64[D]',
+    datetime: 'datetime64[us]',
+}
+
+Rule = Union[Predicate, str, Callable[[np.ndarray], Any]]
+
+
+def _type(fld: attr.Attribute) -> Any:
+    return fld.metadata.get('type') or fld.metadata.get('otype')
+
+
+def _dtype(fld: attr.Attribute) -> Any:
+    return _DTYPES.get(_type(fld), object)
+
+
+def _column(values: List[Any], dtype: Any) -> np.ndarray:
+    if dtype is not object and not any(v is None for v in values):
+        try:
+            return np.asarray(values, dtype=dtype)
+        except (TypeError, ValueError):
+            # nulls or stray values, keep them as they are
+            pass
+    column = np.empty(len(values), dtype=object)
+    column[:] = values
+    return column
+
+
+def _scalar(value: Any) -> Any:
+    return value.item() if isinstance(value, np.generic) else value
+
+
+class Row:
+    """
+    View of one row of a ColumnStore, reads like an instance of its class
+    """
+
+    __slots__ = ('_index', '_store')
+
+    def __init__(self, store: 'ColumnStore', index: int) -> None:
+        self._store = store
+        self._index = index
+
+    def __getattr__(self, name: str) -> Any:
+        columns = self._store.columns
+        if name not in columns:
+            raise AttributeError(
+                f'{self._store.cls.__name__!r} row has no attribute {name!r}'
+            )
+        return _scalar(columns[name][self._index])
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, Row):
+            return self.to_obj() == other.to_obj()
+        return self.to_obj() == other
+
+    __hash__ = None
+
+    def __repr__(self) -> str:
+        values = ', '.join(
+            f'{name}={getattr(self, name)!r}' for name in self._store.columns
+        )
+        return f'{self._store.cls.__name__}({values})'
+
+    def to_obj(self) -> Any:
+        """Materialize the row as an instance of its class"""
+        return self._store.cls(
+            **{
+                fld.name: getattr(self, fld.name)
+                for fld in attr.fields(self._store.cls)
+                if fld.init
+            }
+        )
+
+
+class ColumnStore:
+    """
+    Struct of arrays for instances of one Dynamo class. One NumPy array per
+    field, typed from the field metadata (int=, float=, date..., or the type
+    of the blueprint value), object where values do not fit.
+    """
+
+    def __init__(self, cls: type, columns: Dict[str, np.ndarray]) -> None:
+        self.cls = cls
+        self.columns = columns
+
+    @classmethod
+    def from_instances(
+        cls, dyncls: type, objs: Iterable[Any]
+    ) -> 'ColumnStore':
+        objs = list(objs)
+        return cls(
+            dyncls,
+            {
+                fld.name: _column(
+                    [getattr(o, fld.name) for o in objs], _dtype(fld)
+                )
+                for fld in attr.fields(dyncls)
+                if fld.init
+            },
+        )
+
+    @classmethod
+    def from_records(
+        cls, dyncls: type, records: Iterable[Dict[str, Any]]
+    ) -> 'ColumnStore':
+        """Records keyed by blueprint key or var, missing ones get defaults"""
+        records = list(records)
+        columns = {}
+        for fld in attr.fields(dyncls):
+            if not fld.init:
+                continue
+            key = fld.metadata.get('source', fld.name)
+            default = fld.default
+            if isinstance(default, attr.Factory):
+                default = None
+            values = [r.get(key, r.get(fld.name, default)) for r in records]
+            columns[fld.name] = _column(values, _dtype(fld))
+        return cls(dyncls, columns)
+
+    def __len__(self) -> int:
+        return len(next(iter(self.columns.values()), ()))
+
+    def __iter__(self) -> Iterator[Row]:
+        return (Row(self, i) for i in range(len(self)))
+
+    def __getitem__(self, key: Union[int, str]) -> Any:
+        if isinstance(key, str):
+            return self.columns[key]
+        if key < 0:
+            key += len(self)
+        if not 0 <= key < len(self):
+            raise IndexError(f'Row {key} out of range')
+        return Row(self, key)
+
+    def to_frame(self) -> pd.DataFrame:
+        return pd.DataFrame(self.columns, copy=False)
+
+    def take(self, mask: Any) -> 'ColumnStore':
+        return ColumnStore(
+            self.cls, {k: v[mask] for k, v in self.columns.items()}
+        )
+
+    def mask(self, **rules: Rule) -> np.ndarray:
+        """
+        Row mask of rules per field: a Predicate, a modifier string such as
+        'ge=10#le=20' whose operands take the field type, or a callable
+        taking the column
+        """
+        fields = attr.fields_dict(self.cls)
+        keep = np.ones(len(self), dtype=bool)
+        for field, rule in rules.items():
+            check = rule
+            if isinstance(rule, str):
+                ftype = _type(fields[field]) or str
+                check = predicate({**field_spec(rule), 'type': ftype})
+            keep &= np.asarray(check(self.columns[field]), dtype=bool)
+        return keep
+
+    def filter(self, **rules: Rule) -> 'ColumnStore':
+        return self.take(self.mask(**rules))
+
+    def conforming(self) -> 'ColumnStore':
+        """Rows satisfying the field rules of the class blueprint"""
+        return self.filter(**field_predicates(self.cls))
+
+    def aggregate(
+        self, field: str, func: str = 'sum', by: Optional[str] = None
+    ) -> Any:
+        """
+        func (sum, mean, min, max, count...) over a column, per distinct
+        value of by when given
+        """
+        if by is None:
+            return _scalar(pd.Series(self.columns[field]).agg(func))
+        frame = pd.DataFrame(
+            {'by': self.columns[by], 'value': self.columns[field]}, copy=False
+        )
+        result = frame.groupby('by', sort=False)['value'].agg(func)
+        return {k: _scalar(v) for k, v in result.items()}
@@ -1,19 +1,158 @@
 import datetime
+import hashlib
+import itertools
+import json
 import re
+import time
+import typing
 from pathlib import Path
-from typing import Any, ClassVar, Dict, List, Optional, Set
+from typing import (
+    Any,
+    Callable,
+    ClassVar,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+)
 
 import attr
 import cattrs
 from cattrs import Converter
+from cattrs.gen import (
+    make_dict_structure_fn,
+    make_dict_unstructure_fn,
+    override,
+)
 from icecream import ic
 from jinja2 import Template
 
 import xds.core.impl
+from xds.core.blueprint import (
+    DYNAMIC_CLASS,
+    Blueprint,
+    BlueprintCache,
+    parse_blueprint,
+    with_kinds,
+)
 from xds.core.field import field_spec
-from xds.utils.helpers import SingletonMeta, input_dict, io_stream, xlate
+from xds.utils.helpers import (
+    SingletonMeta,
+    input_dict,
+    input_records,
+    io_stream,
+    xlate,
+)
+from xds.utils.logger import log
+from xds.utils.metrics import metrics
 
-_DYNAMIC_CLASS = 'DynamicClass'
+_DYNAMIC_CLASS = DYNAMIC_CLASS
+
+StructureHook = Callable[[Any, Any], Any]
+
+
+def _internal_getattr(self: Any, name: str) -> Any:
+    """
+    __getattr__ of compact classes, attributes missing on the instance are
+    read from the proxy held in its _internal slot
+    """
+    if name == '_internal':
+        raise AttributeError(name)
+    internal = self._internal
+    if internal is None:
+        raise AttributeError(
+            f'{type(self).__name__!r} object has no attribute {name!r}'
+        )
+    return getattr(internal, name)
+
+
+def _class_info(name: str, dynclass: type) -> Callable[[], str]:
+    def _info() -> str:
+        info = f'\nClass: {name}/{type(dynclass)}\n'
+        for field in attr.fields(dynclass):
+            lst = [
+                v
+                for v in [
+                    field.name,
+                    str(field.type),
+                    str(field.default),
+                    field.metadata.get('title'),
+                ]
+                if v
+            ]
+            info += '  ' + ', '.join(lst) + '\n'
+        return info
+
+    return _info
+
+
+def _scalar_hook(rtype: type, parse: Callable[[Any], Any]) -> StructureHook:
+    return lambda d, _: d if d is None or isinstance(d, rtype) else parse(d)
+
+
+def _list_hook(xtype: type) -> StructureHook:
+    def _hook(d: Any, _: Any) -> Any:
+        if d is None:
+            return d
+        items = d.split(',') if isinstance(d, str) else d
+        return [i if isinstance(i, xtype) else xtype(i) for i in items]
+
+    return _hook
+
+
+def _bool(d: Any) -> bool:
+    return str(d).strip().lower() in ('1', 'true', 'yes', 'y', 'on')
+
+
+# Field spec type => structure hook, picked once per field at d2c time
+_FIELD_HOOKS: Dict[Any, StructureHook] = {
+    int: _scalar_hook(int, int),
+    float: _scalar_hook(float, float),
+    bool: _scalar_hook(bool, _bool),
+    datetime.date: _scalar_hook(datetime.date, datetime.date.fromisoformat),
+    datetime.time: _scalar_hook(datetime.time, datetime.time.fromisoformat),
+    datetime.datetime: _scalar_hook(
+        datetime.datetime, datetime.datetime.fromisoformat
+    ),
+    List[int]: _list_hook(int),
+    List[float]: _list_hook(float),
+    List[bool]: _list_hook(_bool),
+    List[str]: _list_hook(str),
+}
+
+
+def _fingerprint(name: str, data: Dict[str, Any], *mode: Any) -> str:
+    """
+    Canonical content address of a blueprint subtree. Keys are sorted and
+    non json values are folded in with their repr so 1, '1' and a date
+    never collide.
+    """
+    canonical = json.dumps(
+        [name, data, mode], sort_keys=True, default=repr, separators=(',', ':')
+    )
+    return hashlib.blake2b(canonical.encode(), digest_size=16).hexdigest()
+
+
+def _conform(data: Any, cls: Any) -> Any:
+    """
+    Unstructured data trimmed to the keys cls, or its nested classes, still
+    structure from. None values are dropped so their fields get their None
+    default back instead of structuring it, str(None) is 'None'
+    """
+    if isinstance(data, list):
+        return [_conform(item, cls) for item in data]
+    if not isinstance(data, dict) or not attr.has(cls):
+        return data
+    conformed = {}
+    for fld in attr.fields(cls):
+        key = fld.metadata.get('source', fld.name)
+        if fld.init and data.get(key) is not None:
+            args = typing.get_args(fld.type)
+            conformed[key] = _conform(data[key], args[0] if args else fld.type)
+    return conformed
 
 
 class Dynamo(metaclass=SingletonMeta):
@@ -34,18 +173,35 @@ class Dynamo(metaclass=SingletonMeta):
     def __init__(self, **kwargs: Dict[str, Any]):
         self.inputs = input_dict(**kwargs)
         self.serializer: Converter = self._cls_converter()
-        self.serializer: cattrs.Converter = cattrs.Converter(
-            forbid_extra_keys=True
-        )
         # TODO: Hardcoded paths once Env is bootstrapped.
         self.models = {}
+        # fingerprint => (class, {xref: class it was built against})
+        self.classes: Dict[str, Tuple[type, Dict[str, Any]]] = {}
         self.py = {}
         self.args: Set[str] = set()
+        # Called with a kind missing from models, e.g. the registry lazy loader
+        self.resolver: Optional[Callable[[str], Any]] = None
+        self.cache = BlueprintCache(self.inputs.get('cache_dir'))
+        # Compact classes are slotted, no per instance __dict__
+        self.compact = bool(self.inputs.get('compact', False))
+        self.frozen = bool(self.inputs.get('frozen', False))
 
     def d2c(self, **kwargs: Dict[str, Any]) -> type:
-        data: dict[str, Any] = self._inputs(**kwargs)
-        kind: str = data.get('kind', _DYNAMIC_CLASS)
-        return self._from_data(kind, data)
+        blueprint = self.blueprint(**kwargs)
+        return self._from_data(
+            blueprint.kind, blueprint.data, specs=blueprint.specs
+        )
+
+    def blueprint(self, **kwargs: Dict[str, Any]) -> Blueprint:
+        """
+        Compiled blueprint, blueprint files go through the on disk cache.
+        An already compiled one can be handed over as blueprint=
+        """
+        if 'blueprint' in kwargs:
+            return kwargs['blueprint']
+        if 'file' in kwargs:
+            return self.cache.load(kwargs['file'])
+        return parse_blueprint(**kwargs)
 
     def _inputs(self, **kwargs: Dict[str, Any]) -> dict[str, Any]:
         data: dict[str, Any] = input_dict(**kwargs)
@@ -53,89 +209,216 @@ class Dynamo(metaclass=SingletonMeta):
         return data
 
     def _if_missing_cls(self, key, data):
-        if isinstance(data, dict):
-            if 'kind' not in data:
-                data['kind'] = key
-            for k, value in data.items():
-                self._if_missing_cls(k, value)
-        elif isinstance(data, list):
-            for item in data:
-                self._if_missing_cls(key, item)
-        return data
+        return with_kinds(key, data)
 
     def _from_data(
-        self, name: str, data: Dict[str, Any], root: str = ''
+        self,
+        name: str,
+        data: Dict[str, Any],
+        root: str = '',
+        specs: Optional[Dict[str, Any]] = None,
     ) -> Any:
         """
         This is major workhorse to create classes from yaml. Expecting to autogen
         based on metadata. Dirty and needs cleanup
+
+        Classes are cached by the fingerprint of (name, subtree), so reloading
+        a blueprint or sharing a nested shape reuses the generated class. The
+        qualifier metadata is the one of the first path the shape was built at.
+        Precompiled specs, string leaf => field spec, skip modifier parsing.
+        """
+        return self._build(name, data, root, specs)[0]
+
+    def _build(
+        self,
+        name: str,
+        data: Dict[str, Any],
+        root: str = '',
+        specs: Optional[Dict[str, Any]] = None,
+    ) -> Tuple[type, Dict[str, Any]]:
+        """
+        Class for the subtree along with the xref models it, or any of its
+        nested classes, was resolved against
         """
+        fingerprint = _fingerprint(name, data, self.compact, self.frozen)
+        cached = self._cached_class(fingerprint)
+        if cached is not None:
+            metrics.incr('cache_hits_total', cache='class')
+            self.models[name] = cached
+            return cached, self.classes[fingerprint][1]
+        metrics.incr('cache_misses_total', cache='class')
+
         attributes = {}
-        for key, val in data.items():
-            kws = {}
+        xrefs: Dict[str, Any] = {}
+        for key, value in data.items():
             qualifier = f'{root}.{key}' if root else key
-            value = val
-            # if isinstance(value, str) and re.search(r',', value):
-            #    value = value.split(',')
-            if isinstance(value, dict):
-                cls = value['kind']
-                kws['type'] = self._from_data(cls, value, qualifier)
-            elif isinstance(value, list):
-                if value and isinstance(value[0], dict):
-                    cls = value[0]['kind']
-                    kws['type'] = List[
-                        self._from_data(cls, value[0], qualifier)
-                    ]
-                else:
-                    kws['type'] = List[type(value[0])]
-            else:
-                kws['type'] = type(value)
-
-            var, eng = xlate(key)
-            meta = {
-                'qualifier': qualifier.lower(),
-                'var': var,
-                'alias': eng,
-                'key': key,
-                'vtype': type(value),
-                'otype': kws.get('type'),
-            }
-            modifier = field_spec(value) if isinstance(value, str) else {}
-            if modifier:
-                meta.update(modifier)
-            kws['kw_only'] = True
-            if modifier.get('xref'):
-                kws['type'] = self.models.get(modifier.get('xref'))
-            else:
-                kws['default'] = modifier.get('default', None)
-            kws['metadata'] = meta
-            attributes[var] = attr.ib(**kws)
+            var, attribute = self._field(
+                name, key, value, qualifier, specs=specs, xrefs=xrefs
+            )
+            attributes[var] = attribute
 
         attributes['nsid'] = attr.ib(type=str, default=None)
         attributes['uid'] = attr.ib(type=str, default='fta')
-        dynclass = attr.make_class(name, attributes)
-
-        def _info() -> str:
-            cls = dynclass
-            info = f'\nClass: {name}/{type(cls)}\n'
-            for field in attr.fields(cls):
-                lst = [
-                    v
-                    for v in [
-                        field.name,
-                        str(field.type),
-                        str(field.default),
-                        field.metadata.get('title'),
-                    ]
-                    if v
-                ]
-                info += '  ' + ', '.join(lst) + '\n'
-            return info
+        if self.compact:
+            attributes['_internal'] = attr.ib(
+                default=None, init=False, repr=False, eq=False
+            )
+        dynclass = attr.make_class(
+            name, attributes, slots=self.compact, frozen=self.frozen
+        )
+        if self.compact:
+            dynclass.__getattr__ = _internal_getattr
 
-        dynclass.info = _info
+        dynclass.info = _class_info(name, dynclass)
+        self._compile_hooks(dynclass)
         self.models[name] = dynclass
-        print(dynclass.info())
-        return dynclass
+        self.classes[fingerprint] = (dynclass, xrefs)
+        log.debug('{}', dynclass.info)
+        return dynclass, xrefs
+
+    def _field_type(
+        self,
+        value: Any,
+        qualifier: str,
+        specs: Optional[Dict[str, Any]],
+        xrefs: Dict[str, Any],
+    ) -> Any:
+        """Type of a field, nested dicts and lists of dicts build classes"""
+        # if isinstance(value, str) and re.search(r',', value):
+        #    value = value.split(',')
+        if isinstance(value, dict):
+            ncls, nested = self._build(value['kind'], value, qualifier, specs)
+            xrefs.update(nested)
+            return ncls
+        if isinstance(value, list):
+            if value and isinstance(value[0], dict):
+                ncls, nested = self._build(
+                    value[0]['kind'], value[0], qualifier, specs
+                )
+                xrefs.update(nested)
+                return List[ncls]
+            return List[type(value[0])]
+        return type(value)
+
+    def _field(
+        self,
+        name: str,
+        key: str,
+        value: Any,
+        qualifier: str,
+        *,
+        specs: Optional[Dict[str, Any]],
+        xrefs: Dict[str, Any],
+    ) -> Tuple[str, Any]:
+        """var and attr.ib of the blueprint key of class name"""
+        kws: Dict[str, Any] = {
+            'type': self._field_type(value, qualifier, specs, xrefs)
+        }
+        var, eng = xlate(key)
+        meta = {
+            'qualifier': qualifier.lower(),
+            'var': var,
+            'alias': eng,
+            'key': key,
+            # 'key' is overwritten by the key modifier, this one is not
+            'source': key,
+            'vtype': type(value),
+            'otype': kws['type'],
+        }
+        modifier = {}
+        if isinstance(value, str):
+            modifier = (specs or {}).get(value) or field_spec(value)
+        if modifier:
+            meta.update(modifier)
+        kws['kw_only'] = True
+        if key == 'kind':
+            # Bulk structuring relies on this instead of kind injection
+            kws['default'] = modifier.get('default', name)
+        elif modifier.get('xref'):
+            xref = modifier.get('xref')
+            xcls = self._model(xref)
+            if xcls is None:
+                raise ValueError(f'{name}.{key} xrefs {xref}, no such model')
+            kws['type'] = xrefs[xref] = xcls
+        else:
+            kws['default'] = modifier.get('default', None)
+        kws['metadata'] = meta
+        return var, attr.ib(**kws)
+
+    def _model(self, kind: str) -> Optional[type]:
+        cls = self.models.get(kind)
+        if cls is None and self.resolver is not None:
+            cls = self.resolver(kind)
+        return cls
+
+    def _cached_class(self, fingerprint: str) -> Optional[type]:
+        """
+        Cached class for the fingerprint, unless one of the xref models it
+        was built against has since been replaced
+        """
+        entry = self.classes.get(fingerprint)
+        if entry is None:
+            return None
+        cls, xrefs = entry
+        for xref, xcls in xrefs.items():
+            if self._model(xref) is not xcls:
+                return None
+        return cls
+
+    def xrefs(self, cls: type) -> Dict[str, Any]:
+        """xref models the class, or any of its nested classes, was built on"""
+        for dynclass, xrefs in list(self.classes.values()):
+            if dynclass is cls:
+                return xrefs
+        return {}
+
+    def restructure(self, obj: Any, cls: type) -> Any:
+        """
+        Instance carried over to cls, a regenerated class of its kind. Fields
+        dropped from the blueprint are dropped, new ones take their defaults.
+        """
+        data = _conform(self.serializer.unstructure(obj), cls)
+        return self._proxied(cls, self.serializer.structure(data, cls), data)
+
+    def _compile_hooks(self, dynclass: type) -> None:
+        """
+        Generate and register the structure/unstructure functions of the class
+        up front. Field metadata drives them, yaml keys are renamed to their
+        vars and typed modifiers (int=, date, listi...) get a dedicated hook,
+        so instance() never falls back to generic per value dispatch. Renamed
+        fields are still taken by their var, port=5 as well as Port=5.
+        """
+        overrides = {}
+        # var => yaml key of the renamed fields
+        aliases = {}
+        for fld in attr.fields(dynclass):
+            meta = fld.metadata
+            kws = {}
+            key = meta.get('source')
+            if key and key != fld.name:
+                kws['rename'] = aliases[fld.name] = key
+            spec_type = meta.get('type')
+            hook = None if meta.get('xref') else _FIELD_HOOKS.get(spec_type)
+            if hook and fld.type is not spec_type:
+                kws['struct_hook'] = hook
+            if kws:
+                overrides[fld.name] = override(**kws)
+        compiled = make_dict_structure_fn(
+            dynclass, self.serializer, **overrides
+        )
+
+        def aliased(data: Dict[str, Any], cls: type) -> Any:
+            if not aliases.keys().isdisjoint(data):
+                data = {aliases.get(k, k): v for k, v in data.items()}
+            return compiled(data, cls)
+
+        self.serializer.register_structure_hook(
+            dynclass, aliased if aliases else compiled
+        )
+        self.serializer.register_unstructure_hook(
+            dynclass,
+            make_dict_unstructure_fn(dynclass, self.serializer, **overrides),
+        )
 
     @classmethod
     def _cls_converter(cls) -> Converter:
@@ -149,31 +432,89 @@ class Dynamo(metaclass=SingletonMeta):
             set, lambda d, _: list(d) if isinstance(d, list) else d
         )
         converter.register_unstructure_hook(set, list)
-
-        converter.register_structure_hook(
-            str,
-            lambda d, _: datetime.strptime(d, '%Y-%m-%d')
-            if re.match(r'\d{4}-\d{2}-\d{2}', d)
-            else d,
-        )
-        converter.register_structure_hook(
-            str,
-            lambda d, _: d.split(',') if isinstance(d, str) and ',' in d else d,
-        )
         return converter
 
     def instance(self, **kwargs: Dict[str, Any]) -> Optional[Any]:
         data: dict[str, Any] = self._inputs(**kwargs)
         kind: str = data.get('kind', _DYNAMIC_CLASS)
-        cls = self.models.get(kind)
+        cls = self._model(kind)
         assert (
             cls is not None
         ), f'Class {kind} not found. Factory not initialized'
+        start = time.perf_counter()
         obj = self.serializer.structure(data, cls)
-        if hasattr(cls, 'proxy'):
-            print(f'Creating proxy with kwargs: {kwargs}')
+        metrics.observe(
+            'structure_seconds', time.perf_counter() - start, kind=cls.__name__
+        )
+        return self._proxied(cls, obj, kwargs)
+
+    def instances_many(
+        self,
+        records: Optional[Iterable[Dict[str, Any]]] = None,
+        kind: Optional[str] = None,
+        **kwargs: Any,
+    ) -> Iterator[Any]:
+        """
+        Structure records of one kind in bulk. Class and compiled hook are
+        resolved once, records are taken as is (no input_dict, no kind
+        injection) and instances stream out as they are built. Without a kind
+        it is taken from the first record. Without records they are streamed
+        from file=/content= via input_records.
+        """
+        if records is None:
+            records = input_records(**kwargs)
+        rows = iter(records)
+        if kind is None:
+            first = next(rows, None)
+            if first is None:
+                return iter(())
+            kind = first.get('kind', _DYNAMIC_CLASS)
+            rows = itertools.chain((first,), rows)
+        cls = self._model(kind)
+        assert (
+            cls is not None
+        ), f'Class {kind} not found. Factory not initialized'
+        return self._structure_many(cls, rows)
+
+    def _structure_many(
+        self, cls: type, rows: Iterable[Dict[str, Any]]
+    ) -> Iterator[Any]:
+        structure = self.serializer.get_structure_hook(cls)
+        clock = time.perf_counter
+        # one observation for the batch, per row ones cost as much as rows
+        count, seconds = 0, 0.0
+        try:
+            for row in rows:
+                start = clock()
+                obj = structure(row, cls)
+                seconds += clock() - start
+                count += 1
+                yield self._proxied(cls, obj, row)
+        finally:
+            metrics.observe(
+                'structure_seconds', seconds, count, kind=cls.__name__
+            )
+
+    def _proxied(self, cls: type, obj: Any, kwargs: Dict[str, Any]) -> Any:
+        proxy = getattr(cls, 'proxy', None)
+        if self.compact and proxy is not None:
+            # a class or any factory returning the implementation
+            if not callable(proxy):
+                raise ValueError(
+                    f'{cls.__name__}.proxy must be a class or a factory, '
+                    f'not {proxy!r}'
+                )
+            internal = proxy(**kwargs)
+            for attr_name in getattr(internal, '__dict__', ()):
+                if hasattr(cls, attr_name):
+                    raise ValueError(
+                        f'{attr_name} is not allowed to used in implementation'
+                    )
+            object.__setattr__(obj, '_internal', internal)
+        elif not self.compact and hasattr(cls, 'proxy'):
+            log.debug('Creating proxy with kwargs: {}', kwargs)
             obj._internal = cls.proxy(**kwargs)
-            print(f'Created proxy object: {obj._internal}')
+            log.debug('Created proxy object: {}', obj._internal)
             for attr_name, attr_value in vars(obj._internal).items():
                 if hasattr(cls, attr_name):
                     raise ValueError(
@@ -1,5 +1,7 @@
+import functools
+import operator
 import re
-from datetime import datetime
+from datetime import date, datetime, time
 from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
 
 from icecream import ic
@@ -14,20 +16,20 @@ _MODIFIERS = {
     'bool_k': 'req|uniq|key|ro|hide|secret|fuzzy',
 }
 
-_MODIFIERS_PATTERN = re.compile(
-    '|'.join(
-        f'#(?P<k_{key}>{pattern})(?:=(?P<v_k_{key}>.*?))?(?=#|$)(?=#)?'
-        for key, pattern in _MODIFIERS.items()
-    )
-)
+# modifier => its group, first group wins like the alternation it replaced
+_MODIFIER_GROUPS: Dict[str, str] = {
+    name: group
+    for group, names in reversed(_MODIFIERS.items())
+    for name in names.split('|')
+}
 
 _TYPE_MAP = {
     'int': int,
     'float': float,
     'str': str,
     'bool': bool,
-    'date': datetime.date,
-    'time': datetime.time,
+    'date': date,
+    'time': time,
     'dt': datetime,
     'listi': List[int],
     'listf': List[float],
@@ -37,27 +39,67 @@ _TYPE_MAP = {
 }
 
 
+def _bool(raw: str) -> bool:
+    text = raw.strip().lower()
+    if text in ('1', 'true', 'yes', 'y', 'on'):
+        return True
+    if text in ('0', 'false', 'no', 'n', 'off'):
+        return False
+    raise ValueError(f'Not a bool {raw}')
+
+
+# Field type => parser of the values written for it in a modifier string
+_PARSERS: Dict[Any, Callable[[str], Any]] = {
+    bool: _bool,
+    date: date.fromisoformat,
+    time: time.fromisoformat,
+    datetime: datetime.fromisoformat,
+}
+
+
+def value_parser(rtype: Any) -> Callable[[str], Any]:
+    """Parser of modifier string values (defaults, operands) of a type"""
+    return _PARSERS.get(rtype, rtype)
+
+
+class FieldSpec(dict):
+    """
+    Parsed field modifiers. Specs are memoized and shared across blueprints,
+    so they are read only; copy() gives a mutable dict.
+    """
+
+    __slots__ = ()
+
+    def _read_only(self, *args: Any, **kwargs: Any) -> None:
+        raise TypeError('FieldSpec is read only')
+
+    __setitem__ = __delitem__ = __ior__ = _read_only
+    clear = pop = popitem = setdefault = update = _read_only
+
+    def __reduce__(self) -> Tuple[type, Tuple[Dict[str, Any]]]:
+        return FieldSpec, (dict(self),)
+
+
+@functools.lru_cache(maxsize=4096)
 def field_spec(
     input_string: str,
-) -> Optional[List]:
-    matches = re.finditer(_MODIFIERS_PATTERN, f'#{input_string}#')
+) -> FieldSpec:
+    """
+    Single pass over the #name=value#name... tokens of a field modifier
+    string, memoized per string
+    """
     result = {}
-    for match in matches:
-        matched = {
-            key: value
-            for key, value in match.groupdict().items()
-            if value is not None
-        }
-        key = next((k for k in matched.keys() if k.startswith('k_')), None)
-        real_key = matched.get(key, None)
-        if not real_key:
+    for token in input_string.split('#'):
+        real_key, eq, value = token.partition('=')
+        group = _MODIFIER_GROUPS.get(real_key)
+        if group is None:
             continue
-        value = matched.get(f'v_{key}')
-        if key.endswith('_kv') and not value:
+        value = value if eq else None
+        if group.endswith('_kv') and not value:
             raise ValueError(f'{real_key} must have a value')
-        if key.find('_bool') > -1:
+        if group == 'bool_k':
             value = True
-        result.update({real_key: value})
+        result[real_key] = value
 
     types = [
         (k, _TYPE_MAP[k], result.get(k))
@@ -65,49 +107,53 @@ def field_spec(
         if k in _TYPE_MAP
     ]
     if len(types) > 1:
-        raise ValueError(f'Only one type allowed, given {types.keys()}')
+        raise ValueError(
+            f'Only one type allowed, given {[t[0] for t in types]}'
+        )
     if not types:
         types = [('str', str, None)]
     dtype, rtype, default = types[0]
     result['type'] = rtype
     if default:
         if dtype.startswith('list'):
-            xtype = rtype.__args__[0]
+            xtype = value_parser(rtype.__args__[0])
             result['default'] = [xtype(i) for i in default.split(',')]
         else:
-            result['default'] = rtype(default)
+            result['default'] = value_parser(rtype)(default)
     if result.get('in'):
-        result['in'] = [rtype(i) for i in result['in'].split(',')]
-    return result
+        cast = value_parser(rtype)
+        result['in'] = [cast(i) for i in result['in'].split(',')]
+    return FieldSpec(result)
+
+
+_OPERATORS: Dict[str, Callable[[Any, Any], bool]] = {
+    'eq': operator.eq,
+    'ne': operator.ne,
+    'gt': operator.gt,
+    'lt': operator.lt,
+    'ge': operator.ge,
+    'le': operator.le,
+}
+
+_OPERATIONS: Dict[str, Callable[[Any, Any], bool]] = {
+    'has': lambda v, c: v in c,
+    'end': lambda v, c: c[-1] == v if c else False,
+    'start': lambda v, c: c[0] == v if c else False,
+    'in': lambda v, c: v in c,
+    'enum': lambda v, c: v in c,
+    'range': lambda v, c: all(x >= v[0] and x <= v[1] for x in c),
+}
 
 
 def cmp_value(value1: Any, value2: Any, operator: str) -> bool:
-    operators: Dict[str, Callable[[Any, Any], bool]] = {
-        'eq': lambda x, y: x == y,
-        'ne': lambda x, y: x != y,
-        'gt': lambda x, y: x > y,
-        'lt': lambda x, y: x < y,
-        'ge': lambda x, y: x >= y,
-        'le': lambda x, y: x <= y,
-    }
-
-    if operator not in operators:
+    if operator not in _OPERATORS:
         raise ValueError(f'Invalid operator: {operator}')
 
-    return operators[operator](value1, value2)
+    return _OPERATORS[operator](value1, value2)
 
 
 def query_operation(operation: str, value: Any, collection: List[Any]) -> bool:
-    operations = {
-        'has': lambda v, c: v in c,
-        'end': lambda v, c: c[-1] == v if c else False,
-        'start': lambda v, c: c[0] == v if c else False,
-        'in': lambda v, c: v in c,
-        'enum': lambda v, c: v in c,
-        'range': lambda v, c: all(x >= v[0] and x <= v[1] for x in c),
-    }
-
-    if operation not in operations:
+    if operation not in _OPERATIONS:
         raise ValueError(f'Invalid operation: {operation}')
 
-    return operations[operation](value, collection)
+    return _OPERATIONS[operation](value, collection)
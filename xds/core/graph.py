@@ -0,0 +1,83 @@
+from typing import Dict, Iterable, List, Mapping, Set
+
+import attr
+
+from xds.core.blueprint import Blueprint
+
+
+@attr.s(frozen=True)
+class ModelGraph:
+    """
+    xref dependencies between blueprints, model => models it xrefs. Kinds
+    already built (known) satisfy an xref without being part of the graph.
+    """
+
+    deps = attr.ib(type=Dict[str, Set[str]])
+    # model => xref kinds neither a blueprint nor a known model provides
+    missing = attr.ib(type=Dict[str, Set[str]], factory=dict)
+
+    @classmethod
+    def from_blueprints(
+        cls, blueprints: Mapping[str, Blueprint], known: Iterable[str] = ()
+    ) -> 'ModelGraph':
+        kinds = {
+            kind.lower(): model
+            for model, bp in blueprints.items()
+            for kind in bp.kinds
+        }
+        known = {k.lower() for k in known}
+        deps: Dict[str, Set[str]] = {model: set() for model in blueprints}
+        missing: Dict[str, Set[str]] = {}
+        for model, bp in blueprints.items():
+            for xref in bp.xrefs:
+                dep = kinds.get(xref.lower())
+                if dep is not None:
+                    if dep != model:
+                        deps[model].add(dep)
+                elif xref.lower() not in known:
+                    missing.setdefault(model, set()).add(xref)
+        return cls(deps, missing)
+
+    def levels(self) -> List[List[str]]:
+        """
+        Models grouped so each group only xrefs earlier ones, the models of
+        a group are independent of each other. Raises on cycles.
+        """
+        done: Set[str] = set()
+        levels = []
+        left = list(self.deps)
+        while left:
+            level = [m for m in left if self.deps[m] <= done]
+            if not level:
+                cycle = ' -> '.join(self._cycle(set(left)))
+                raise ValueError(f'Cyclic xrefs between models: {cycle}')
+            levels.append(level)
+            done.update(level)
+            left = [m for m in left if m not in done]
+        return levels
+
+    def order(self) -> List[str]:
+        """Models after the models they xref"""
+        return [model for level in self.levels() for model in level]
+
+    def check(self) -> 'ModelGraph':
+        """Raises on xrefs to unknown models or on cycles"""
+        if self.missing:
+            unknown = ', '.join(
+                f'{model} => {sorted(xrefs)}'
+                for model, xrefs in sorted(self.missing.items())
+            )
+            raise ValueError(f'xrefs to unknown models: {unknown}')
+        self.levels()
+        return self
+
+    def _cycle(self, nodes: Set[str]) -> List[str]:
+        # every node left waits on another one left, walk until one repeats
+        path: List[str] = []
+        seen: Dict[str, int] = {}
+        node = min(nodes)
+        while node not in seen:
+            seen[node] = len(path)
+            path.append(node)
+            node = min(self.deps[node] & nodes)
+        return [*path[seen[node] :], node]
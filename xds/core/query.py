@@ -0,0 +1,172 @@
+import functools
+import operator
+from datetime import date
+from typing import Any, Callable, Dict, Iterable, List, Mapping, Tuple
+
+import attr
+import numpy as np
+import pandas as pd
+
+from xds.core.field import value_parser
+
+_COMPARE: Dict[str, Callable[[Any, Any], Any]] = {
+    'eq': operator.eq,
+    'ne': operator.ne,
+    'gt': operator.gt,
+    'lt': operator.lt,
+    'ge': operator.ge,
+    'le': operator.le,
+    'max': operator.le,
+    'min': operator.ge,
+}
+
+# Modifiers a field rule is made of, op_kv and query_kv of field_spec
+_RULES = (*_COMPARE, 'has', 'end', 'start', 'in', 'enum', 'range')
+
+
+def _starts(x: Any, v: Any) -> bool:
+    if isinstance(x, str):
+        return x.startswith(v)
+    return bool(x) and x[0] == v
+
+
+def _ends(x: Any, v: Any) -> bool:
+    if isinstance(x, str):
+        return x.endswith(v)
+    return bool(x) and x[-1] == v
+
+
+_SCALAR: Dict[str, Callable[[Any, Any], bool]] = {
+    **_COMPARE,
+    'in': lambda x, v: x in v,
+    'enum': lambda x, v: x in v,
+    'has': lambda x, v: v in x,
+    'start': _starts,
+    'end': _ends,
+    'range': lambda x, v: v[0] <= x <= v[1],
+}
+
+
+def _is_text(s: pd.Series) -> bool:
+    return pd.api.types.infer_dtype(s, skipna=True) == 'string'
+
+
+def _elementwise(fn: Callable[[Any, Any], bool]) -> Callable[..., Any]:
+    return lambda s, v: s.map(lambda x: fn(x, v))
+
+
+_VECTOR: Dict[str, Callable[[pd.Series, Any], Any]] = {
+    **_COMPARE,
+    'in': lambda s, v: s.isin(v),
+    'enum': lambda s, v: s.isin(v),
+    'has': lambda s, v: (
+        s.str.contains(v, regex=False)
+        if _is_text(s)
+        else _elementwise(_SCALAR['has'])(s, v)
+    ),
+    'start': lambda s, v: (
+        s.str.startswith(v) if _is_text(s) else _elementwise(_starts)(s, v)
+    ),
+    'end': lambda s, v: (
+        s.str.endswith(v) if _is_text(s) else _elementwise(_ends)(s, v)
+    ),
+    'range': lambda s, v: s.between(v[0], v[1]),
+}
+
+
+def _caster(spec: Mapping[str, Any]) -> Callable[[str], Any]:
+    rtype = spec.get('type', str)
+    # list fields are matched element wise against their item type
+    return value_parser(getattr(rtype, '__args__', (rtype,))[0])
+
+
+def _operand(name: str, raw: Any, cast: Callable[[str], Any]) -> Any:
+    if name in ('in', 'enum', 'range'):
+        vals = raw.split(',') if isinstance(raw, str) else list(raw)
+        vals = [cast(v) if isinstance(v, str) else v for v in vals]
+        if name == 'range' and len(vals) != 2:  # noqa: PLR2004
+            raise ValueError(f'range needs lower,upper given {raw}')
+        return tuple(vals)
+    return cast(raw) if isinstance(raw, str) else raw
+
+
+def _stamp(v: Any) -> Any:
+    """date/datetime operands as Timestamps, to compare datetime64 columns"""
+    if isinstance(v, tuple):
+        return tuple(_stamp(x) for x in v)
+    return pd.Timestamp(v) if isinstance(v, date) else v
+
+
+@attr.s(frozen=True, slots=True)
+class Predicate:
+    """
+    Field rules (gt=5#in=a,b...) compiled once. Calling it on a scalar gives
+    a bool, on a NumPy array or pandas Series a boolean mask. Nulls never
+    match.
+    """
+
+    rules = attr.ib(type=Tuple[Tuple[str, Any], ...])
+
+    def __call__(self, value: Any) -> Any:
+        if isinstance(value, (np.ndarray, pd.Series)):
+            return self.mask(value)
+        if value is None:
+            return False
+        return all(_SCALAR[name](value, v) for name, v in self.rules)
+
+    def mask(self, values: Any) -> np.ndarray:
+        s = values if isinstance(values, pd.Series) else pd.Series(values)
+        notna = s.notna().to_numpy()
+        result = notna.copy()
+        if not self.rules or not notna.any():
+            return result
+        valid = s[notna]
+        stamps = pd.api.types.is_datetime64_any_dtype(valid)
+        for name, v in self.rules:
+            hits = _VECTOR[name](valid, _stamp(v) if stamps else v)
+            result[notna] &= np.asarray(hits, dtype=bool)
+        return result
+
+    def select(self, objs: Iterable[Any], field: str) -> List[Any]:
+        """Objects whose field satisfies the rules, evaluated as one mask"""
+        objs = list(objs)
+        values = pd.Series([getattr(o, field) for o in objs], dtype=object)
+        if len(values):
+            values = values.infer_objects()
+        keep = self.mask(values)
+        return [o for o, k in zip(objs, keep) if k]
+
+
+def predicate(spec: Mapping[str, Any]) -> Predicate:
+    """
+    Predicate out of the op_kv/query_kv modifiers of a field spec, operands
+    cast to the spec type
+    """
+    cast = _caster(spec)
+    rules = tuple(
+        (name, _operand(name, spec[name], cast))
+        for name in _RULES
+        if spec.get(name) is not None
+    )
+    return Predicate(rules)
+
+
+@functools.lru_cache(maxsize=1024)
+def field_predicates(cls: type) -> Dict[str, Predicate]:
+    """
+    Predicates of the fields of a Dynamo class that carry rules, compiled
+    once per class
+    """
+    return {
+        fld.name: predicate(fld.metadata)
+        for fld in attr.fields(cls)
+        if any(fld.metadata.get(name) is not None for name in _RULES)
+    }
+
+
+def conforming(objs: Iterable[Any], cls: type) -> List[Any]:
+    """Instances of cls satisfying every field rule of their blueprint"""
+    objs = list(objs)
+    for field, rule in field_predicates(cls).items():
+        objs = rule.select(objs, field)
+    return objs
@@ -1,12 +1,31 @@
-from pathlib import Path
-from typing import Any, Dict, Optional
+import functools
+import itertools
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
 
 import attr
 from icecream import ic
 
+from xds.core.blueprint import compile_blueprint
+from xds.core.columnar import ColumnStore
 from xds.core.dynamo import Dynamo
-from xds.utils.helpers import SingletonMeta, io_path, io_stream
+from xds.core.field import field_spec
+from xds.core.graph import ModelGraph
+from xds.core.query import field_predicates
+from xds.utils.helpers import ShardedDict, SingletonMeta, io_path, io_stream
 from xds.utils.logger import log
+from xds.utils.metrics import metrics
+
+
+def _stamp(path: Any) -> Optional[Tuple[int, int]]:
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
 
 
 @attr.s(kw_only=True)
@@ -15,14 +34,139 @@ class Registry(metaclass=SingletonMeta):
     ns = attr.ib(factory=dict)
     models = attr.ib(factory=dict)
     instances = attr.ib(factory=dict)
+    lazy = attr.ib(default=True)
+    # lock stripes of the namespaces, registration only locks one of them
+    shards = attr.ib(default=16)
+    # processes parsing blueprints on preload, 0/1 parses in process
+    workers = attr.ib(default=0)
     env = attr.ib(init=False)
+    # model => blueprint path, for models not built yet
+    pending = attr.ib(init=False, factory=dict)
+    # model => Blueprint parsed ahead of its build
+    compiled = attr.ib(init=False, factory=dict, repr=False)
+    # last ns segment => ns ids ending with it, for fuzzy lookups
+    leaves = attr.ib(init=False, factory=dict, repr=False)
+    # file read => ('models' or 'instances', key of what it registered)
+    sources = attr.ib(init=False, factory=dict, repr=False)
+    # file read => (mtime_ns, size) as of its last read
+    stamps = attr.ib(init=False, factory=dict, repr=False)
+    _lock = attr.ib(init=False, factory=threading.RLock, repr=False)
+    _located = attr.ib(init=False, default=None, repr=False)
+    # memoized lookups are keyed by generation, registrations bump it
+    _generation = attr.ib(init=False, default=0, repr=False)
+    _generations = attr.ib(
+        init=False, factory=lambda: itertools.count(1), repr=False
+    )
+    _watching = attr.ib(init=False, default=None, repr=False)
 
     def __attrs_post_init__(self):
+        self.ns = ShardedDict(self.shards, self.ns)
+        self.models = ShardedDict(self.shards, self.models)
+        self.instances = ShardedDict(self.shards, self.instances)
+        self.leaves = ShardedDict(self.shards, self.leaves)
+        self._located = functools.lru_cache(maxsize=4096)(self._locate)
+        self.factory.resolver = self._resolve
         self._env_init()
-        models = self.env.models.split(',')
-        for model in models:
-            log.info(f'Initializing Model {model}')
-            self._model_init(model, dir=self.env.blueprints)
+        self._pending_init()
+        if not self.lazy:
+            self.preload()
+
+    def _pending_init(self) -> None:
+        """Models of the env not built yet, env reloads may add some"""
+        for model in self.env.models.split(','):
+            fpath = io_path(file=f'{model}.yaml', dir=self.env.blueprints)
+            if str(fpath) not in self.sources:
+                self.pending.setdefault(model.lower(), fpath)
+
+    def preload(self, background: bool = False) -> Optional[threading.Thread]:
+        """
+        Build every pending model, on a daemon thread if background. Lazy
+        lookups from other threads interleave model by model.
+
+        Blueprints are compiled first, in a process pool with workers > 1,
+        then classes are built in the topological order of their xrefs.
+        xrefs to unknown models and cyclic xrefs raise before any is built.
+        """
+        if background:
+            thread = threading.Thread(
+                target=self.preload, name='xds-preload', daemon=True
+            )
+            thread.start()
+            return thread
+        self._compile_pending()
+        for model in [*self.graph().order(), *list(self.pending)]:
+            with self._lock:
+                if model in self.pending:
+                    self._load(model)
+        return None
+
+    def graph(self) -> ModelGraph:
+        """Checked xref graph of the pending models, compiling them first"""
+        self._compile_pending()
+        blueprints = {
+            m: self.compiled[m]
+            for m in list(self.pending)
+            if m in self.compiled
+        }
+        return ModelGraph.from_blueprints(
+            blueprints, known=list(self.factory.models)
+        ).check()
+
+    def _compile_pending(self) -> None:
+        models = [m for m in list(self.pending) if m not in self.compiled]
+        if not models:
+            return
+        files = [self.pending[m] for m in models]
+        if self.workers > 1:
+            cache_dir = str(self.factory.cache.root)
+            log.info(
+                f'Compiling {len(files)} blueprints on {self.workers} workers'
+            )
+            with ProcessPoolExecutor(max_workers=self.workers) as pool:
+                blueprints = list(
+                    pool.map(
+                        compile_blueprint, files, itertools.repeat(cache_dir)
+                    )
+                )
+        else:
+            blueprints = [self.factory.blueprint(file=f) for f in files]
+        self.compiled.update(zip(models, blueprints))
+
+    def _resolve(self, kind: str) -> Any:
+        """
+        Model for the kind, building its blueprint on first use. Blueprint
+        names need not match their kind (enum => Enumeration), other kinds
+        are looked up by the kind of the compiled pending blueprints, only
+        the model found is built.
+        """
+        key = kind.lower()
+        with self._lock:
+            if key in self.models:
+                return self.models[key]
+            model = key if key in self.pending else self._kind_model(key)
+            if model is not None:
+                self._load(model)
+            return self.models.get(key)
+
+    def _kind_model(self, key: str) -> Optional[str]:
+        """Pending model whose blueprint is of kind key, None when none is"""
+        self._compile_pending()
+        for model in list(self.pending):
+            blueprint = self.compiled.get(model)
+            if blueprint is not None and blueprint.kind.lower() == key:
+                return model
+        return None
+
+    def _load(self, model: str) -> None:
+        fpath = self.pending.pop(model)
+        log.debug('Initializing Model {}', model)
+        try:
+            self._model_init(
+                model, file=fpath, blueprint=self.compiled.pop(model, None)
+            )
+        except Exception:
+            self.pending[model] = fpath
+            raise
 
     def _env_init(self) -> Any:
         mdir = 'xds/catalogue/blueprints'
@@ -35,21 +179,190 @@ class Registry(metaclass=SingletonMeta):
         return env
 
     def _model_init(self, model: str, **kwargs: Dict[str, Any]) -> Any:
+        blueprint = kwargs.pop('blueprint', None)
         if 'file' not in kwargs:
             kwargs['file'] = f'{model}.yaml'
         fpath = io_path(**kwargs)
-        cls = self.factory.d2c(file=fpath)
+        stamp = _stamp(fpath)
+        start = time.perf_counter()
+        if blueprint is not None:
+            cls = self.factory.d2c(blueprint=blueprint)
+        else:
+            cls = self.factory.d2c(file=fpath)
+        metrics.observe(
+            'build_seconds', time.perf_counter() - start, model=cls.__name__
+        )
         self._ns_init('models', cls)
+        self._track(fpath, 'models', self._ns_id('models', cls)[1], stamp)
 
     def instance(self, **kwargs: Dict[str, Any]) -> Any:
         file = kwargs.get('file')
-        if file and not Path.exists(Path(kwargs['file'])):
+        stamp = None
+        if file:
+            # the path as given wins, io_path only falls back to the config dir
             kwargs['file'] = io_path(dir=self.config, file=file)
-            log.info(f'Initializing from {kwargs["file"]}')
+            stamp = _stamp(kwargs['file'])
+            log.debug('Initializing from {}', kwargs['file'])
         inst = self.factory.instance(**kwargs)
         self._ns_init('instances', inst)
+        if file:
+            oid = self._ns_id('instances', inst)[1]
+            self._track(kwargs['file'], 'instances', oid, stamp)
         return inst
 
+    def _track(
+        self, path: Any, what: str, oid: str, stamp: Optional[Tuple[int, int]]
+    ) -> None:
+        self.sources[str(path)] = (what, oid)
+        self.stamps[str(path)] = stamp
+
+    def watch(self, interval: float = 1.0) -> threading.Thread:
+        """
+        Poll the blueprint and config files read so far every interval
+        seconds on a daemon thread, reloading what changed, until unwatch()
+        """
+        self.unwatch()
+        stop = threading.Event()
+
+        def _poll() -> None:
+            while not stop.wait(interval):
+                try:
+                    self.reload()
+                except Exception as e:
+                    log.error(f'Reload failed: {e}')
+
+        thread = threading.Thread(target=_poll, name='xds-watch', daemon=True)
+        self._watching = (thread, stop)
+        thread.start()
+        return thread
+
+    def unwatch(self) -> None:
+        if self._watching:
+            thread, stop = self._watching
+            stop.set()
+            thread.join()
+            self._watching = None
+
+    def reload(self) -> List[str]:
+        """
+        One poll of the files read so far. Changed blueprints are rebuilt
+        along with the models that xref them, registered instances of the
+        regenerated classes are carried over to them and changed instance
+        files are read again. Returns the ns ids reloaded.
+        """
+        with self._lock:
+            changed = []
+            for path in list(self.sources):
+                stamp = _stamp(path)
+                if stamp is not None and stamp != self.stamps.get(path):
+                    # even if the reload fails, retried on the next change only
+                    self.stamps[path] = stamp
+                    changed.append(path)
+            if not changed:
+                return []
+            replaced = self._rebuild(
+                [p for p in changed if self.sources[p][0] == 'models']
+            )
+            reloaded = [
+                self._ns_id('models', cls)[0]
+                for cls in replaced.values()
+                if self.models.get(cls.__name__.lower()) is cls
+            ]
+            reloaded += self._restructure(replaced)
+            for path in changed:
+                what, oid = self.sources[path]
+                if what == 'instances':
+                    reloaded += self._reload_instance(path, oid)
+            return reloaded
+
+    def _rebuild(self, paths: List[str]) -> Dict[type, type]:
+        """
+        Models of the blueprints rebuilt, then the ones that xref a class
+        replaced by that until none is left. Old class => its replacement.
+        """
+        before = dict(self.factory.models)
+        done: Set[str] = set()
+        replaced: Dict[type, type] = {}
+        while paths:
+            for path in paths:
+                done.add(path)
+                log.info(f'Reloading model from {path}')
+                try:
+                    self._model_init(self.sources[path][1], file=path)
+                except Exception as e:
+                    log.error(f'Keeping the current model of {path}: {e}')
+            replaced = {
+                old: self.factory.models[name]
+                for name, old in before.items()
+                if self.factory.models.get(name, old) is not old
+            }
+            paths = [
+                path
+                for path, (what, oid) in list(self.sources.items())
+                if what == 'models'
+                and path not in done
+                and oid in self.models
+                and not replaced.keys().isdisjoint(
+                    self.factory.xrefs(self.models[oid]).values()
+                )
+            ]
+        return replaced
+
+    def _restructure(self, replaced: Dict[type, type]) -> List[str]:
+        reloaded = []
+        for oid, inst in list(self.instances.items()):
+            cls = replaced.get(type(inst))
+            if cls is None:
+                continue
+            try:
+                new = self.factory.restructure(inst, cls)
+            except Exception as e:
+                log.error(f'Keeping instances/{oid} as is: {e}')
+                continue
+            self._ns_init('instances', new)
+            if inst is self.env:
+                self.env = new
+            reloaded.append(f'instances/{oid}')
+        return reloaded
+
+    def _reload_instance(self, path: str, oid: str) -> List[str]:
+        old = self.instances.get(oid)
+        log.info(f'Reloading instance from {path}')
+        try:
+            new = self.instance(file=path)
+        except Exception as e:
+            log.error(f'Keeping instances/{oid} as is: {e}')
+            return []
+        ns_id, new_oid = self._ns_id('instances', new)
+        if new_oid != oid and self.instances.get(oid) is old:
+            self._ns_drop('instances', oid)
+        if old is not None and old is self.env:
+            self.env = new
+            self._pending_init()
+        return [ns_id]
+
+    def instances_many(
+        self,
+        records: Optional[Iterable[Dict[str, Any]]] = None,
+        kind: Optional[str] = None,
+        **kwargs: Any,
+    ) -> Iterator[Any]:
+        if 'file' in kwargs:
+            kwargs['file'] = io_path(dir=self.config, file=kwargs['file'])
+        insts = self.factory.instances_many(records, kind=kind, **kwargs)
+        return self._register_many(insts)
+
+    def columns(self, kind: str) -> ColumnStore:
+        """Registered instances of the kind as one columnar store"""
+        cls = self.factory.models.get(kind) or self.model(kind)
+        insts = [i for i in self.instances.values() if type(i) is cls]
+        return ColumnStore.from_instances(cls, insts)
+
+    def _register_many(self, insts: Iterable[Any]) -> Iterator[Any]:
+        for inst in insts:
+            self._ns_init('instances', inst)
+            yield inst
+
     def _inst_file(self, **kwargs: Dict[str, Any]) -> str:
         config: str = kwargs.get('config')
         if 'file' in kwargs:
@@ -67,41 +380,125 @@ class Registry(metaclass=SingletonMeta):
         """
         This could have uid tag and environment specific id
         """
+        ns_id, oid = self._ns_id(what, obj)
+        self.ns[ns_id] = obj
+        self._ns_index(what, oid, ns_id, obj)
+
+    def register(self, obj: Any, what: str = 'instances') -> Any:
+        """
+        Atomic register-or-get. obj is registered unless its ns id is already
+        taken, in which case the registered object is returned instead.
+        """
+        ns_id, oid = self._ns_id(what, obj)
+        current = self.ns.setdefault(ns_id, obj)
+        if current is obj:
+            self._ns_index(what, oid, ns_id, obj)
+        return current
+
+    def _ns_id(self, what: str, obj: Any) -> Tuple[str, str]:
         oid = obj.__class__.__name__
         if what == 'models':
             oid = obj.__name__.lower()
-            self.models[oid] = obj
         elif what == 'instances':
             oid = f'{obj.__class__.__name__}/{obj.ns}'.lower()
+        return f'{what}/{oid}', oid
+
+    def _ns_index(self, what: str, oid: str, ns_id: str, obj: Any) -> None:
+        if what == 'models':
+            self.models[oid] = obj
+        elif what == 'instances':
             self.instances[oid] = obj
+            metrics.incr('instances_total', kind=obj.__class__.__name__)
+        leaf = ns_id.rsplit('/', 1)[-1]
+        with self.leaves.lock(leaf):
+            # copy on write, fuzzy lookups never see a set being mutated
+            self.leaves[leaf] = self.leaves.get(leaf, frozenset()) | {ns_id}
+        self._invalidate()
+        if not isinstance(obj, type):
+            # frozen instances included
+            object.__setattr__(obj, 'nsid', ns_id)
+        elif '__slots__' not in vars(obj):
+            # on a slotted class it would shadow the nsid slot of instances
+            obj.nsid = ns_id
+        log.debug('Initialized {} NS => {}', what, ns_id)
+
+    def _ns_drop(self, what: str, oid: str) -> None:
         ns_id = f'{what}/{oid}'
-        self.ns[ns_id] = obj
-        obj.nsid = ns_id
-        log.info(f'Initialized {what} NS => {ns_id}')
+        self.ns.pop(ns_id, None)
+        getattr(self, what).pop(oid, None)
+        leaf = ns_id.rsplit('/', 1)[-1]
+        with self.leaves.lock(leaf):
+            self.leaves[leaf] = self.leaves.get(leaf, frozenset()) - {ns_id}
+        self._invalidate()
+
+    def _invalidate(self) -> None:
+        # a lookup racing this one stores its result under the old
+        # generation, where no later lookup reads it
+        self._generation = next(self._generations)
+        self._located.cache_clear()
 
     def locator(self, nskey: str) -> Any:
-        obj = self.ns.get(nskey.lower())
+        """
+        Recent resolutions are memoized per generation of the namespaces,
+        any registration starts a new one
+        """
+        return self._located(nskey, self._generation)
+
+    def _locate(self, nskey: str, generation: int = 0) -> Any:
+        key = nskey.lower()
+        obj = self.ns.get(key)
         if obj:
+            metrics.incr('lookups_total', result='hit')
             return obj
 
-        parts = nskey.split('/')
+        parts = key.split('/')
         if nskey.startswith('models/'):
-            obj = self.models.get(parts[1])
+            obj = self.models.get(parts[1]) or self._resolve(parts[1])
             if obj:
+                metrics.incr('lookups_total', result='hit')
                 return obj
 
         if nskey.startswith('instances/'):
             obj = self.instances.get(f'{parts[1]}/{parts[2]}')
             if obj:
+                metrics.incr('lookups_total', result='hit')
                 return obj
             else:
-                last = f'/{parts[-1]}'
-                found = [i for i in self.ns if i.endswith(last)]
+                found = self.leaves.get(parts[-1], ())
                 if len(found) == 1:
-                    log.info(f'Found {found[0]} for {nskey} with fuzzy search')
-                    return self.ns[found[0]]
+                    (nsid,) = found
+                    log.debug('Found {} for {} with fuzzy search', nsid, nskey)
+                    metrics.incr('lookups_total', result='fuzzy')
+                    return self.ns[nsid]
+        metrics.incr('lookups_total', result='miss')
         return None
 
+    def metrics(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Snapshot of build/structure latencies, instance counts, cache hit
+        ratios and lookup outcomes. Memoized lookups are read off their
+        lru_cache statistics at snapshot time.
+        """
+        self._cache_gauges()
+        return metrics.snapshot()
+
+    def metrics_text(self) -> str:
+        """metrics() in Prometheus text format, for a /metrics endpoint"""
+        self._cache_gauges()
+        return metrics.text()
+
+    def _cache_gauges(self) -> None:
+        for cache, memoized in (
+            ('locator', self._located),
+            ('field_spec', field_spec),
+            ('field_predicates', field_predicates),
+        ):
+            info = memoized.cache_info()
+            metrics.total('cache_hits_total', info.hits, cache=cache)
+            metrics.total('cache_misses_total', info.misses, cache=cache)
+        metrics.gauge('models', len(self.models))
+        metrics.gauge('instances', len(self.instances))
+
     def model(self, clstr: str) -> Any:
         cls = self.locator(f'models/{clstr}')
         assert cls, f'Class {clstr} not found in registry, Registred =>\n{self.models.keys()}'
@@ -2,7 +2,8 @@ from datetime import date, datetime
 from dateutil.relativedelta import relativedelta
 import re
 from typing import Any, Optional
-from icecream import ic
+
+from xds.utils.logger import log
 
 _DATE_MODIFIER = re.compile(r'([TBDWMQY])*([+-])*(\d+)*([DWMQY])*([SE])*')
 
@@ -18,7 +19,14 @@ def date_modifier(date_pattern: str, dt: Optional[str] = None) -> date:
     mult = -1 if sign == '-' else 1
     units = units if units else dt or 'D'
     terms = int(terms or 0) * mult
-    ic(date_pattern, base, sign, mult, terms, units, adjust)
+    log.trace(
+        'date_modifier {} base={} terms={} units={} adjust={}',
+        date_pattern,
+        base,
+        terms,
+        units,
+        adjust,
+    )
     base = dated(base, units, terms)
     base = move_date(base, date_pattern, mult)
     return base.strftime('%Y-%m-%d')
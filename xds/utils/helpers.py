@@ -2,9 +2,25 @@ from __future__ import annotations
 
 import datetime
 import json
+import mmap
+import os
 import re
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import MutableMapping
 from pathlib import Path
-from typing import Any, ClassVar, Dict, List, Optional, Tuple, TypeAlias
+from typing import (
+    IO,
+    Any,
+    ClassVar,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    TypeAlias,
+)
 from urllib.parse import parse_qs, urlparse
 
 import attr
@@ -14,34 +30,185 @@ import yaml
 from flatten_dict import flatten
 from icecream import ic
 
+from xds.utils.logger import log
+from xds.utils.metrics import metrics
+
 _NO_XLATIONS_SPECIALS = ['LOB', 'PL', 'PI']
 
 
 XlationMap: TypeAlias = Dict[str, Dict[str, str]]
 ic.configureOutput(prefix='DEBUG:', includeContext=True)
 
+# Safe loaders fastest first, 'c' needs PyYAML built against libyaml
+_YAML_LOADERS: Dict[str, Optional[type]] = {
+    'c': getattr(yaml, 'CSafeLoader', None),
+    'python': yaml.SafeLoader,
+}
+
+
+class YamlBackend:
+    """
+    Safe yaml loader in use, picked on first use from XDS_YAML_LOADER, else
+    the fastest available
+    """
+
+    def __init__(self) -> None:
+        self._loader: Optional[type] = None
+
+    def set(self, backend: Optional[str] = None) -> type:
+        """
+        Pin the yaml backend ('c' or 'python'), None or 'auto' picks the
+        fastest available. Defaults to XDS_YAML_LOADER, else auto.
+        """
+        backend = (backend or os.getenv('XDS_YAML_LOADER') or 'auto').lower()
+        if backend == 'auto':
+            loader = next(ldr for ldr in _YAML_LOADERS.values() if ldr)
+        elif backend not in _YAML_LOADERS:
+            raise ValueError(
+                f'Unknown yaml backend {backend}, expected auto|'
+                + '|'.join(_YAML_LOADERS)
+            )
+        elif _YAML_LOADERS[backend] is None:
+            raise ValueError(f'yaml backend {backend} is not available')
+        else:
+            loader = _YAML_LOADERS[backend]
+        self._loader = loader
+        return loader
+
+    @property
+    def loader(self) -> type:
+        return self._loader or self.set()
+
+
+yaml_backend = YamlBackend()
+
+
+def set_yaml_backend(backend: Optional[str] = None) -> type:
+    return yaml_backend.set(backend)
+
+
+def yaml_loader() -> type:
+    return yaml_backend.loader
+
+
+def yaml_load(stream: Any) -> Any:
+    return yaml.load(stream, Loader=yaml_loader())
+
+
+def yaml_load_all(stream: Any) -> Iterator[Any]:
+    return yaml.load_all(stream, Loader=yaml_loader())
+
 
 class SingletonMeta(type):
     _instances: ClassVar[Dict[str, Any]] = {}
+    # Reentrant, a singleton may construct another one in its __init__
+    _lock: ClassVar[threading.RLock] = threading.RLock()
 
     def __call__(cls, *args: Any, **kwargs: Any) -> Any:
         if cls not in cls._instances:
-            instance = super().__call__(*args, **kwargs)
-            cls._instances[cls] = instance
+            with cls._lock:
+                if cls not in cls._instances:
+                    instance = super().__call__(*args, **kwargs)
+                    cls._instances[cls] = instance
         return cls._instances[cls]
 
 
+class ShardedDict(MutableMapping):
+    """
+    Dict split over lock striped shards. Reads are plain dict lookups, writes
+    only lock the shard of their key, so writers on different keys do not
+    contend on one global lock.
+    """
+
+    def __init__(self, shards: int = 16, data: Optional[Dict] = None) -> None:
+        self._shards: List[Dict[Any, Any]] = [{} for _ in range(shards)]
+        self._locks = [threading.RLock() for _ in range(shards)]
+        if data:
+            self.update(data)
+
+    def _slot(self, key: Any) -> int:
+        return hash(key) % len(self._shards)
+
+    def lock(self, key: Any) -> threading.RLock:
+        """Lock of the shard holding key, for read-modify-write updates"""
+        return self._locks[self._slot(key)]
+
+    def __getitem__(self, key: Any) -> Any:
+        return self._shards[self._slot(key)][key]
+
+    def get(self, key: Any, default: Any = None) -> Any:
+        return self._shards[self._slot(key)].get(key, default)
+
+    def __contains__(self, key: Any) -> bool:
+        return key in self._shards[self._slot(key)]
+
+    def __setitem__(self, key: Any, value: Any) -> None:
+        slot = self._slot(key)
+        with self._locks[slot]:
+            self._shards[slot][key] = value
+
+    def __delitem__(self, key: Any) -> None:
+        slot = self._slot(key)
+        with self._locks[slot]:
+            del self._shards[slot][key]
+
+    def setdefault(self, key: Any, default: Any = None) -> Any:
+        slot = self._slot(key)
+        with self._locks[slot]:
+            return self._shards[slot].setdefault(key, default)
+
+    def __iter__(self) -> Iterator[Any]:
+        for shard in self._shards:
+            yield from list(shard)
+
+    def __len__(self) -> int:
+        return sum(len(shard) for shard in self._shards)
+
+    def __repr__(self) -> str:
+        return repr(dict(self.items()))
+
+
+# numpy dtype kind => python type of its values
+_KIND_TYPES: Dict[str, type] = {
+    'i': int,
+    'u': int,
+    'f': float,
+    'b': bool,
+    'c': complex,
+    'M': pd.Timestamp,
+    'm': pd.Timedelta,
+}
+
+
+def _type_name(ptype: type) -> str:
+    if ptype is datetime.date:
+        return 'date'
+    if issubclass(ptype, pd.DataFrame):
+        return 'pd'
+    if ptype.__module__ == 'builtins':
+        return ptype.__qualname__
+    return f'{ptype.__module__}.{ptype.__qualname__}'
+
+
 def df_pytypes(df: pd.DataFrame) -> Dict[str, str]:
-    overrides = {
-        'datetime.date': 'date',
-        'pandas.core.frame.DataFrame': 'pd',
-    }
-    types = {
-        col: str(df[col].apply(type).unique()[0]).split("'")[1] for col in df.columns
-    }
-    for col, ptype in types.items():
-        if ptype in overrides:
-            types[col] = overrides[ptype]
+    """
+    Python type name per column, off the dtype where it tells, else off the
+    first non null value. Nested frames are 'pd', dates 'date'.
+    """
+    types = {}
+    for col, dtype in df.dtypes.items():
+        ptype = _KIND_TYPES.get(dtype.kind)
+        if isinstance(dtype, pd.StringDtype):
+            ptype = str
+        if ptype is None:
+            series = df[col]
+            first = series.first_valid_index()
+            value = None if first is None else series.loc[first]
+            if isinstance(value, pd.Series):
+                # duplicate labels, first one
+                value = value.iloc[0]
+            ptype = type(value)
+        types[col] = _type_name(ptype)
     return types
 
 
@@ -74,19 +241,111 @@ def icf(var: Any, header: Optional[str] = None) -> None:
     ic(var)
 
 
+class FileCache:
+    """
+    Decoded file contents keyed by path, reused while the file mtime and size
+    are unchanged. Files of mmap_min bytes or more are read through a memory
+    map. Least recently used entries are evicted past max_bytes.
+    """
+
+    def __init__(
+        self, max_bytes: int = 64 << 20, mmap_min: int = 1 << 20
+    ) -> None:
+        self.max_bytes = max_bytes
+        self.mmap_min = mmap_min
+        self.size = 0
+        self._entries: OrderedDict[str, Tuple[int, int, str]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def read(self, path: Any) -> str:
+        key = os.fspath(path)
+        stat = os.stat(key)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[:2] == (stat.st_mtime_ns, stat.st_size):
+                self._entries.move_to_end(key)
+                metrics.incr('cache_hits_total', cache='file')
+                return entry[2]
+        metrics.incr('cache_misses_total', cache='file')
+        text = self._load(key, stat.st_size)
+        with self._lock:
+            self._evict(key)
+            if stat.st_size <= self.max_bytes:
+                self._entries[key] = (stat.st_mtime_ns, stat.st_size, text)
+                self.size += stat.st_size
+                while self.size > self.max_bytes:
+                    self._evict(next(iter(self._entries)))
+        return text
+
+    def _load(self, key: str, size: int) -> str:
+        with open(key, 'rb') as fp:
+            if size < self.mmap_min:
+                text = fp.read().decode('utf-8')
+            else:
+                # decoded off the mapping, no bytes copy of the file
+                with mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    text = str(mm, 'utf-8')
+        # same newline handling as a text mode read
+        if '\r' in text:
+            text = text.replace('\r\n', '\n').replace('\r', '\n')
+        return text
+
+    def _evict(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry:
+            self.size -= entry[1]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+
+file_cache = FileCache()
+
+# (dir, file) => monotonic time until which it is known to be missing, in
+# expiry order; expired ones are dropped as misses come in, past
+# _MISSING_MAX the oldest go
+_MISSING: Dict[Tuple[str, str], float] = {}
+_MISSING_TTL = 1.0
+_MISSING_MAX = 4096
+_missing_lock = threading.Lock()
+
+
+def _missed(key: Tuple[str, str]) -> None:
+    now = time.monotonic()
+    with _missing_lock:
+        _MISSING.pop(key, None)
+        while _MISSING and (
+            len(_MISSING) >= _MISSING_MAX
+            or next(iter(_MISSING.values())) <= now
+        ):
+            del _MISSING[next(iter(_MISSING))]
+        _MISSING[key] = now + _MISSING_TTL
+
+
 def io_stream(**kwargs: Dict[str, Any]) -> Optional[str]:
     path = io_path(**kwargs)
     try:
-        with open(path, 'r', encoding='utf-8') as fp:
-            return fp.read()
+        return file_cache.read(path)
     except Exception as e:
-        print(f'Error: An I/O reading the file {path}: {e}')
+        log.error('An I/O error reading the file {}: {}', path, e)
     return None
 
 
 def io_path(**kwargs: Dict[str, Any]) -> Path:
+    """
+    file as given, else under dir. Misses are remembered for _MISSING_TTL
+    seconds so repeated probes for absent files skip the stat calls.
+    """
     file: str = kwargs.get('file')
     dir: str = kwargs.get('dir')
+    key = (str(dir), str(file))
+    missing = _MISSING.get(key)
+    if missing is not None:
+        if missing > time.monotonic():
+            raise FileNotFoundError(f'File Not found for {dir}/{file}')
+        _MISSING.pop(key, None)
     cpath = Path(file)
     if cpath.exists():
         return cpath
@@ -94,14 +353,21 @@ def io_path(**kwargs: Dict[str, Any]) -> Path:
         fpath = Path(dir, file)
         if fpath.exists():
             return fpath
+    _missed(key)
     raise FileNotFoundError(f'File Not found for {dir}/{file}')
 
 
+def io_cache_clear() -> None:
+    """Forget cached contents and misses, e.g. after writing files"""
+    file_cache.clear()
+    _MISSING.clear()
+
+
 def read_yaml(contents: Optional[str]) -> Optional[Any]:
     if contents is None:
         return None
     try:
-        return yaml.safe_load(contents)
+        return yaml_load(contents)
     except yaml.YAMLError as e:
         ic(f'Error parsing YAML: {e}')
     except Exception as e:
@@ -173,13 +439,122 @@ def input_dict(**kwargs: Any) -> Dict[str, Any]:
         data = parse_content(parse_url(kwargs['url']))
 
     else:
-        icf(f'Creating data from kwargs: {kwargs}')
-        data = kwargs
+        log.trace('Creating data from kwargs: {}', kwargs)
+        # caller owned, callers mutate what they get back
+        return cattrs.structure(kwargs, Dict[str, Any])
 
     if data is None:
         raise ValueError('No data returned')
+    if not isinstance(data, dict):
+        raise ValueError(f'Expected a mapping, got {type(data).__name__}')
+
+    # freshly parsed, no copy needed
+    return data
+
+
+_JSON_CHUNK = 1 << 16
+_JSON_WS = ' \t\n\r'
+
+
+def input_records(**kwargs: Any) -> Iterator[Dict[str, Any]]:
+    """
+    Top level records streamed one at a time without materializing the whole
+    document: documents of a multi document yaml, items of a json array or
+    lines of json lines (.jsonl/.ndjson). A document that is a list yields
+    its items. Records are handed over as parsed, no copy.
+    """
+    if 'file' not in kwargs:
+        if 'content' in kwargs:
+            for doc in yaml_load_all(kwargs['content']):
+                yield from _records(doc)
+        else:
+            yield input_dict(**kwargs)
+        return
+
+    file_path = str(kwargs['file'])
+    suffix = file_path.lower().rsplit('.', 1)[-1]
+    with open(io_path(**kwargs), 'r', encoding='utf-8') as fp:
+        if suffix in ('yaml', 'yml'):
+            for doc in yaml_load_all(fp):
+                yield from _records(doc)
+        elif suffix in ('jsonl', 'ndjson'):
+            for line in fp:
+                if line.strip():
+                    yield json.loads(line)
+        elif suffix == 'json':
+            yield from _JsonArray(fp)
+        else:
+            raise ValueError(f'Unsupported file format: {file_path}')
+
 
-    return cattrs.structure(data, Dict[str, Any])
+def _records(doc: Any) -> Iterator[Dict[str, Any]]:
+    if isinstance(doc, list):
+        yield from doc
+    elif doc is not None:
+        yield doc
+
+
+class _JsonArray:
+    """
+    Items of a top level json array decoded chunk by chunk, any other
+    document is read whole
+    """
+
+    def __init__(self, fp: IO[str]) -> None:
+        self.fp = fp
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def _more(self) -> bool:
+        chunk = self.fp.read(_JSON_CHUNK)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buf = self.buf[self.pos :] + chunk
+        self.pos = 0
+        return True
+
+    def _peek(self) -> str:
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in _JSON_WS:
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._more():
+                return ''
+
+    def _decode(self) -> Any:
+        while True:
+            try:
+                obj, end = self.decoder.raw_decode(self.buf, self.pos)
+                # a value ending the buffer may be cut short, e.g. a number
+                if end < len(self.buf) or self.eof:
+                    self.pos = end
+                    return obj
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self._more()
+
+    def __iter__(self) -> Iterator[Any]:
+        if self._peek() != '[':
+            rest = self.buf[self.pos :] + self.fp.read()
+            yield from _records(json.loads(rest) if rest.strip() else None)
+            return
+        self.pos += 1
+        if self._peek() == ']':
+            return
+        while True:
+            self._peek()
+            yield self._decode()
+            sep = self._peek()
+            if sep == ']':
+                return
+            if sep != ',':
+                raise ValueError(f'Malformed json array near {sep!r}')
+            self.pos += 1
 
 
 def pprint_obj(obj: Any, indent: int = 2) -> None:
@@ -1,10 +1,37 @@
 from loguru import logger
 import sys
 import os  # Import os to access environment variables
+import types
+from typing import Any, Callable, Dict, Optional, Union
+
+Message = Union[str, Callable[[], str]]
+
+# Deferred values are plain functions, lambdas and bound methods; classes
+# and other callable objects are logged as they are
+_DEFERRED = (types.FunctionType, types.MethodType)
+
+
+def _value(arg: Any) -> Any:
+    return arg() if isinstance(arg, _DEFERRED) else arg
 
 
 class Logger:
+    """
+    Level gated loguru front. A call below the level returns before any
+    formatting, so messages are best given lazily: either a function
+    returning the message or a {} template whose args are only formatted,
+    and called when functions, once the level is enabled.
+
+        log.debug('Built {}', cls.info)
+
+    Level is XDS_LOG_LEVEL, else INFO when env is prod/production, else DEBUG
+    """
+
     def __init__(self):
+        self.level = 'DEBUG'
+        self._threshold = 0
+        self._handler: Optional[int] = None
+        self._levels: Dict[str, int] = {}
         self.configure_logger()
 
     def configure_logger(self):
@@ -13,32 +40,61 @@ class Logger:
         self.set_logging_level(environment)
 
     def set_logging_level(self, environment: str) -> None:
-        self._add_handler(sys.stderr, 'DEBUG')
+        default = (
+            'INFO' if environment.lower() in ('prod', 'production') else 'DEBUG'
+        )
+        self.set_level(os.getenv('XDS_LOG_LEVEL') or default)
+
+    def set_level(self, level: str) -> None:
+        self.level = level.upper()
+        self._threshold = self._no(self.level)
+        if self._handler is not None:
+            logger.remove(self._handler)
+        self._handler = self._add_handler(sys.stderr, self.level)
 
-    def _add_handler(self, stream, level: str) -> None:
-        logger.add(
+    def _add_handler(self, stream, level: str) -> int:
+        return logger.add(
             stream,
             level=level,
             format='{time:YYYY-MM-DD HH:mm:ss} | {level} | {message}',
         )
 
-    def info(self, message: str) -> None:
-        logger.info(message)
+    def _no(self, level: str) -> int:
+        if level not in self._levels:
+            self._levels[level] = logger.level(level).no
+        return self._levels[level]
+
+    def enabled(self, level: str) -> bool:
+        return self._no(level) >= self._threshold
+
+    def _log(self, level: str, message: Message, *args: Any, **kwargs: Any):
+        if self._no(level) < self._threshold:
+            return
+        message = _value(message)
+        if args or kwargs:
+            args = tuple(_value(a) for a in args)
+            kwargs = {k: _value(v) for k, v in kwargs.items()}
+            logger.opt(depth=2).log(level, message, *args, **kwargs)
+        else:
+            logger.opt(depth=2).log(level, message)
+
+    def info(self, message: Message, *args: Any, **kwargs: Any) -> None:
+        self._log('INFO', message, *args, **kwargs)
 
-    def debug(self, message: str) -> None:
-        logger.debug(message)
+    def debug(self, message: Message, *args: Any, **kwargs: Any) -> None:
+        self._log('DEBUG', message, *args, **kwargs)
 
-    def error(self, message: str) -> None:
-        logger.error(message)
+    def error(self, message: Message, *args: Any, **kwargs: Any) -> None:
+        self._log('ERROR', message, *args, **kwargs)
 
-    def warn(self, message: str) -> None:
-        logger.warning(message)
+    def warn(self, message: Message, *args: Any, **kwargs: Any) -> None:
+        self._log('WARNING', message, *args, **kwargs)
 
-    def trace(self, message: str) -> None:
-        logger.trace(message)
+    def trace(self, message: Message, *args: Any, **kwargs: Any) -> None:
+        self._log('TRACE', message, *args, **kwargs)
 
-    def critical(self, message: str) -> None:
-        logger.critical(message)
+    def critical(self, message: Message, *args: Any, **kwargs: Any) -> None:
+        self._log('CRITICAL', message, *args, **kwargs)
 
 
 log = Logger()
@@ -0,0 +1,200 @@
+import bisect
+import contextlib
+import os
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Tuple
+
+# Latency bucket upper bounds in seconds, 10us to 10s
+_BUCKETS: Tuple[float, ...] = (
+    1e-5,
+    5e-5,
+    1e-4,
+    5e-4,
+    1e-3,
+    5e-3,
+    1e-2,
+    5e-2,
+    0.1,
+    0.5,
+    1.0,
+    5.0,
+    10.0,
+)
+
+Key = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+
+def _key(name: str, labels: Dict[str, Any]) -> Key:
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _series(key: Key, **extra: Any) -> str:
+    name, labels = key
+    pairs = [*labels, *((k, str(v)) for k, v in extra.items())]
+    if not pairs:
+        return name
+    return name + '{' + ','.join(f'{k}="{v}"' for k, v in pairs) + '}'
+
+
+class Metrics:
+    """
+    Counters, gauges and latency histograms. Every thread writes to its own
+    shard, so recording takes no lock and never races; snapshots merge the
+    shards. XDS_METRICS=0 turns recording into a no-op.
+
+    Series are named after Prometheus, counters end in _total and latency
+    histograms in _seconds. cache_hits_total/cache_misses_total of a cache
+    give its cache_hit_ratio.
+    """
+
+    def __init__(self, buckets: Tuple[float, ...] = _BUCKETS) -> None:
+        self.buckets = buckets
+        self.enabled = os.getenv('XDS_METRICS', '1') != '0'
+        self.gauges: Dict[Key, float] = {}
+        # counters kept elsewhere, e.g. lru_cache statistics, as last read
+        self.totals: Dict[Key, int] = {}
+        self._local = threading.local()
+        self._shards: List[Tuple[Dict[Key, int], Dict[Key, List[float]]]] = []
+        # only taken once per thread, when its shard is created
+        self._lock = threading.Lock()
+
+    def _shard(self) -> Tuple[Dict[Key, int], Dict[Key, List[float]]]:
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = self._local.shard = ({}, {})
+            with self._lock:
+                self._shards.append(shard)
+            return shard
+
+    def incr(self, name: str, n: int = 1, **labels: Any) -> None:
+        if not self.enabled:
+            return
+        counters = self._shard()[0]
+        key = _key(name, labels)
+        counters[key] = counters.get(key, 0) + n
+
+    def gauge(self, name: str, value: float, **labels: Any) -> None:
+        self.gauges[_key(name, labels)] = value
+
+    def total(self, name: str, value: int, **labels: Any) -> None:
+        """Counter kept outside, set to its current total"""
+        self.totals[_key(name, labels)] = value
+
+    def observe(
+        self, name: str, seconds: float, count: int = 1, **labels: Any
+    ) -> None:
+        """
+        Latency samples, kept as counts per bucket, then the sample count
+        and sum. count > 1 records a batch taking seconds in all, bucketed
+        at its mean.
+        """
+        if not self.enabled or count < 1:
+            return
+        histograms = self._shard()[1]
+        key = _key(name, labels)
+        hist = histograms.get(key)
+        if hist is None:
+            hist = histograms[key] = [0] * (len(self.buckets) + 3)
+        hist[bisect.bisect_left(self.buckets, seconds / count)] += count
+        hist[-2] += count
+        hist[-1] += seconds
+
+    @contextlib.contextmanager
+    def timer(self, name: str, **labels: Any) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def reset(self) -> None:
+        with self._lock:
+            for counters, histograms in self._shards:
+                counters.clear()
+                histograms.clear()
+            self.gauges.clear()
+            self.totals.clear()
+
+    def _merged(self) -> Tuple[Dict[Key, int], Dict[Key, List[float]]]:
+        counters: Dict[Key, int] = self.totals.copy()
+        histograms: Dict[Key, List[float]] = {}
+        with self._lock:
+            shards = list(self._shards)
+        for shard_counters, shard_histograms in shards:
+            # dict.copy is atomic, the owning thread may be writing
+            for key, n in shard_counters.copy().items():
+                counters[key] = counters.get(key, 0) + n
+            for key, hist in shard_histograms.copy().items():
+                merged = histograms.setdefault(key, [0] * len(hist))
+                for i, v in enumerate(list(hist)):
+                    merged[i] += v
+        return counters, histograms
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Plain dict of every series, keyed name{label="value",...}. Bucket
+        counts are cumulative like Prometheus ones.
+        """
+        counters, histograms = self._merged()
+        snap: Dict[str, Dict[str, Any]] = {
+            'counters': {_series(k): v for k, v in sorted(counters.items())},
+            'gauges': {
+                _series(k): v for k, v in sorted(self.gauges.copy().items())
+            },
+            'histograms': {},
+            'ratios': {},
+        }
+        for key, hist in sorted(histograms.items()):
+            cumulative, buckets = 0, {}
+            for bound, n in zip((*self.buckets, float('inf')), hist):
+                cumulative += n
+                buckets[bound] = cumulative
+            snap['histograms'][_series(key)] = {
+                'count': hist[-2],
+                'sum': hist[-1],
+                'buckets': buckets,
+            }
+        for (name, labels), hits in counters.items():
+            if name != 'cache_hits_total':
+                continue
+            misses = counters.get(('cache_misses_total', labels), 0)
+            if hits + misses:
+                ratio_key = ('cache_hit_ratio', labels)
+                snap['ratios'][_series(ratio_key)] = hits / (hits + misses)
+        return snap
+
+    def text(self, prefix: str = 'xds_') -> str:
+        """Prometheus text exposition of the series"""
+        counters, histograms = self._merged()
+        lines: List[str] = []
+        typed = set()
+
+        def _type(name: str, kind: str) -> None:
+            if name not in typed:
+                typed.add(name)
+                lines.append(f'# TYPE {prefix}{name} {kind}')
+
+        for key, n in sorted(counters.items()):
+            _type(key[0], 'counter')
+            lines.append(f'{prefix}{_series(key)} {n}')
+        for key, v in sorted(self.gauges.copy().items()):
+            _type(key[0], 'gauge')
+            lines.append(f'{prefix}{_series(key)} {v}')
+        for key, hist in sorted(histograms.items()):
+            name, labels = key
+            _type(name, 'histogram')
+            cumulative = 0
+            for bound, n in zip((*self.buckets, float('inf')), hist):
+                cumulative += n
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                series = _series((f'{name}_bucket', labels), le=le)
+                lines.append(f'{prefix}{series} {cumulative}')
+            for suffix, v in (('sum', hist[-1]), ('count', hist[-2])):
+                series = _series((f'{name}_{suffix}', labels))
+                lines.append(f'{prefix}{series} {v}')
+        return '\n'.join(lines) + '\n'
+
+
+metrics = Metrics()